@@ -46,6 +46,72 @@ def update_mastering_probability_for_declarative_knowledge_component(initial_m_p
     return logistic_function(theta)
 
 
+def update_mastering_probabilities_for_procedural_knowledge_components(initial_m_pbas, successes, params):
+    """
+    Array version of update_mastering_probability_for_procedural_knowledge_component, updating a whole cohort at once.
+    :param initial_m_pbas: np.array, mastering probabilities before evaluation
+    :param successes: np.array of booleans, the results of the answers -- broadcast against initial_m_pbas
+    :param params: dict of floats or np.array broadcast against initial_m_pbas -- must contain learn, guess and slip
+    params
+    :return: np.array, the updated mastering probabilities
+    """
+    initial_m_pbas = np.asarray(initial_m_pbas, dtype=float)
+    learn, guess, slip = params['learn'], params['guess'], params['slip']
+    m_pba_given_answer = np.where(successes, initial_m_pbas * (1 - slip), initial_m_pbas * slip)
+    m_pba_given_answer /= m_pba_given_answer + np.where(successes, (1 - initial_m_pbas) * guess,
+                                                        (1 - initial_m_pbas) * (1 - guess))
+    return m_pba_given_answer + (1 - m_pba_given_answer) * learn
+
+
+def update_mastering_probabilities_for_declarative_knowledge_components(initial_m_pbas, successes, params):
+    """
+    Array version of update_mastering_probability_for_declarative_knowledge_component, updating a whole cohort at once.
+    :param initial_m_pbas: np.array, mastering probabilities before evaluation
+    :param successes: np.array of booleans, the results of the answers -- broadcast against initial_m_pbas
+    :param params: dict of floats or np.array broadcast against initial_m_pbas -- must contain guess, delta and gamma
+    params
+    :return: np.array, the updated mastering probabilities
+    """
+    initial_m_pbas = np.asarray(initial_m_pbas, dtype=float)
+    guess, delta, gamma = params['guess'], params['delta'], params['gamma']
+    # probability to answer correctly, guess + (1 - guess) * logistic_function(theta)
+    success_pba = guess + (1 - guess) * initial_m_pbas
+    theta = np.log(initial_m_pbas / (1 - initial_m_pbas))
+    theta += np.where(successes, gamma * (1 - success_pba), delta * success_pba)
+    return 1 / (1 + np.exp(-theta))
+
+
+def scan_mastering_probabilities(initial_m_pbas, successes, params, behavior='procedural', mask=None):
+    """
+    Apply the updates of the mastering probabilities of a cohort along sequences of answers, one vectorized update of
+    the whole cohort per step.
+    :param initial_m_pbas: np.array of shape (n,), mastering probabilities before the first answer
+    :param successes: np.array of booleans of shape (n, n_steps), the results of the answers of each sequence
+    :param params: dict of floats or np.array broadcast against successes (e.g. of shape (n, 1) for one value per
+    sequence, or (n, n_steps) for one value per answer) -- see the updates of the given behavior
+    :param behavior: str, 'procedural' or 'declarative'
+    :param mask: np.array of booleans of shape (n, n_steps), False for the padding steps of the shorter sequences,
+    which do not change the mastering probabilities
+    :return: np.array of shape (n, n_steps+1), the mastering probabilities after each answer
+    """
+    assert behavior in ('declarative', 'procedural'), "Given behavior unknown."
+    update = update_mastering_probabilities_for_procedural_knowledge_components if behavior == 'procedural' else \
+        update_mastering_probabilities_for_declarative_knowledge_components
+    successes = np.asarray(successes, dtype=bool)
+    n, n_steps = successes.shape
+    # one contiguous row per step
+    successes = np.ascontiguousarray(successes.T)
+    step_params = {name: np.ascontiguousarray(np.broadcast_to(value, (n, n_steps)).T) for name, value in params.items()}
+    m_pbas = np.empty((n_steps + 1, n))
+    m_pbas[0] = initial_m_pbas
+    for step in range(n_steps):
+        m_pbas[step + 1] = update(m_pbas[step], successes[step],
+                                  {name: value[step] for name, value in step_params.items()})
+        if mask is not None:
+            m_pbas[step + 1] = np.where(mask[:, step], m_pbas[step + 1], m_pbas[step])
+    return m_pbas.T
+
+
 class KnowledgeComponent(object):
 
     def __init__(self, kc_id: int, kc_name: str, exercises=None):
@@ -129,10 +129,10 @@ def compute_centrality(G, centrality='betweenness', verbose=3):
     return(G, score)
 
 #%% compute clusters
-def cluster(G, verbose=3):
+def cluster(G, verbose=3, random_state=None):
     if verbose>=3: print('[NETWORK.cluster] Clustering using best partition')
-    # Partition
-    partition=community.best_partition(G)
+    # Partition (random_state fixes the order in which the Louvain method visits the nodes)
+    partition=community.best_partition(G, random_state=random_state)
     # Set property to node
     nx.set_node_attributes(G, partition, 'clusterlabel')
     # Extract labels
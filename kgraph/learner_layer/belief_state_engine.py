@@ -0,0 +1,199 @@
+import numpy as np
+import hashlib
+from collections import deque
+
+
+class BeliefStateEngine(object):
+    """
+    Base class of the engines that carry the belief state of a learner forward one learner trace at a time. A subclass
+    compiles the emission tensor of every exercise of its KCs into answer_likelihoods and defines
+    get_initial_belief_state and update.
+    """
+    answer_likelihoods = None
+    kc_axes = None
+
+    def get_initial_belief_state(self):
+        """
+        Return the belief state of a learner at time 0.
+        """
+        raise NotImplementedError
+
+    def update(self, belief, trace):
+        """
+        Carry a belief state forward through one learner trace (evidence, then transition).
+        """
+        raise NotImplementedError
+
+    def get_answer_likelihood(self, exercise, success):
+        """
+        Return the likelihood of an answer given the state (not mastered, mastered) of the evaluated KC.
+        """
+        return self.answer_likelihoods[exercise][int(success)]
+
+    def iter_filter(self, learner_traces):
+        """
+        Forward filtering over a sequence of learner traces, yielding the belief states one after the other so that
+        only the last one is held in memory.
+        :param learner_traces: iterable of LearnerTrace objects, in chronological order
+        :return: generator of the len(learner_traces)+1 belief states, the i-th one taking into account the i first
+        traces
+        """
+        belief = self.get_initial_belief_state()
+        yield belief
+        for trace in learner_traces:
+            belief = self.update(belief, trace)
+            yield belief
+
+    def filter(self, learner_traces):
+        """
+        Forward filtering over a sequence of learner traces.
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :return: list of the len(learner_traces)+1 belief states, the i-th one taking into account the i first traces
+        """
+        return list(self.iter_filter(learner_traces))
+
+    def predict(self, learner_traces):
+        """
+        Return the belief state of a learner after a sequence of learner traces, without keeping the intermediate ones.
+        """
+        belief = self.get_initial_belief_state()
+        for trace in learner_traces:
+            belief = self.update(belief, trace)
+        return belief
+
+    def pack_learner_traces(self, learner_traces):
+        """
+        Pack the traces of several learners into padded arrays.
+        :param learner_traces: list of lists of LearnerTrace objects (or dict {learner: list of LearnerTrace objects}),
+        one list per learner in chronological order
+        :return: (kc_axes, success_likelihoods, successes, mask), np.array of shapes (n_learners, n_steps),
+        (n_learners, n_steps, 2), (n_learners, n_steps) and (n_learners, n_steps), being the axis of the evaluated KC
+        (-1 for the KCs the engine does not handle), the probability of a success given the state of the evaluated KC,
+        the success of the answer and whether the step is a trace or padding
+        """
+        if isinstance(learner_traces, dict):
+            learner_traces = list(learner_traces.values())
+        n_steps = max((len(traces) for traces in learner_traces), default=0)
+        kc_axes = np.full((len(learner_traces), n_steps), -1, dtype=int)
+        success_likelihoods = np.ones((len(learner_traces), n_steps, 2))
+        successes = np.zeros((len(learner_traces), n_steps), dtype=bool)
+        mask = np.zeros((len(learner_traces), n_steps), dtype=bool)
+        for i, traces in enumerate(learner_traces):
+            mask[i, :len(traces)] = True
+            for j, trace in enumerate(traces):
+                if trace.get_kc() in self.kc_axes:
+                    kc_axes[i, j] = self.kc_axes[trace.get_kc()]
+                    success_likelihoods[i, j] = self.answer_likelihoods[trace.get_exercise()][1]
+                successes[i, j] = trace.get_success()
+        return kc_axes, success_likelihoods, successes, mask
+
+
+class SmoothingEngine(BeliefStateEngine):
+    """
+    Base class of the exact engines, which also condition the belief states on the learner traces that follow them.
+    A subclass defines the backward messages P(following answers | state) through _get_initial_message, _backward_step
+    and _condition.
+    """
+    knowledge_components = None
+    pool_knowledge_components = None
+    pool_kc_axes = None
+
+    def get_compiled_arrays(self):
+        """
+        Return the compiled arrays of the engine, but the emission tensors, which define the belief states it computes.
+        :return: list of np.array
+        """
+        raise NotImplementedError
+
+    def get_marginals(self, belief):
+        """
+        Return the mastering probability of every KC from a belief state.
+        :return: np.array of shape (..., n_kcs)
+        """
+        raise NotImplementedError
+
+    def get_fingerprint(self):
+        """
+        Return a fingerprint of the compiled parameters of the engine, which identifies the belief states it computes
+        from given learner traces.
+        :return: str, the hexadecimal sha1 digest of the KCs and of the compiled tensors
+        """
+        if getattr(self, '_fingerprint', None) is None:
+            fingerprint = hashlib.sha1()
+            fingerprint.update(f"{type(self).__name__}{[kc.id for kc in self.knowledge_components]}".encode())
+            for array in self.get_compiled_arrays():
+                fingerprint.update(np.ascontiguousarray(array).tobytes())
+            for exercise in sorted(self.answer_likelihoods, key=lambda exercise: exercise.id):
+                fingerprint.update(repr(exercise.id).encode())
+                fingerprint.update(self.answer_likelihoods[exercise].tobytes())
+            self._fingerprint = fingerprint.hexdigest()
+        return self._fingerprint
+
+    def _get_initial_message(self):
+        """
+        Return the backward message of the last time slice, on which no evidence follows.
+        """
+        raise NotImplementedError
+
+    def _backward_step(self, message, trace):
+        """
+        Carry a backward message P(future evidence | state of the next time slice) to the time slice of a trace.
+        """
+        raise NotImplementedError
+
+    def _condition(self, belief, message):
+        """
+        Condition a belief state on the evidence of a backward message.
+        """
+        raise NotImplementedError
+
+    def smooth_with_lag(self, belief, learner_traces):
+        """
+        Condition a belief state on the learner traces that follow it.
+        :param belief: the belief state of a time slice given the previous traces
+        :param learner_traces: list of LearnerTrace objects, the traces from this time slice on
+        :return: the belief state of the time slice given all the traces
+        """
+        message = self._get_initial_message()
+        for trace in learner_traces[::-1]:
+            message = self._backward_step(message, trace)
+        return self._condition(belief, message)
+
+    def smooth(self, learner_traces):
+        """
+        Forward-backward smoothing over a sequence of learner traces.
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :return: (filtered, smoothed), two np.array of shape (len(learner_traces)+1, n_kcs) in the KC order of the
+        learner pool; filtered[i] takes into account the i first traces, smoothed[i] takes into account all of them
+        """
+        beliefs = self.filter(learner_traces)
+        message = self._get_initial_message()
+        smoothed = [beliefs[-1]]
+        for i in range(len(learner_traces) - 1, -1, -1):
+            message = self._backward_step(message, learner_traces[i])
+            smoothed.append(self._condition(beliefs[i], message))
+        filtered = self.get_marginals(np.stack(beliefs))[:, self.pool_kc_axes]
+        smoothed = self.get_marginals(np.stack(smoothed[::-1]))[:, self.pool_kc_axes]
+        return filtered, smoothed
+
+    def fixed_lag_smooth(self, learner_traces, lag):
+        """
+        Fixed-lag smoothing over a sequence of learner traces, keeping only lag+1 belief states in memory.
+        :param learner_traces: iterable of LearnerTrace objects, in chronological order
+        :param lag: int, the number of following traces taken into account for each time slice
+        :return: np.array of shape (n_traces+1, n_kcs) in the KC order of the learner pool, the i-th row taking into
+        account the i+lag first traces
+        """
+        window_beliefs, window_traces = deque([self.get_initial_belief_state()]), deque()
+        smoothed = []
+        for trace in learner_traces:
+            window_traces.append(trace)
+            window_beliefs.append(self.update(window_beliefs[-1], trace))
+            if len(window_traces) == lag + 1:
+                smoothed.append(self.smooth_with_lag(window_beliefs.popleft(), list(window_traces)[:lag]))
+                window_traces.popleft()
+        while window_beliefs:
+            smoothed.append(self.smooth_with_lag(window_beliefs.popleft(), list(window_traces)))
+            if window_traces:
+                window_traces.popleft()
+        return self.get_marginals(np.stack(smoothed))[:, self.pool_kc_axes]
@@ -0,0 +1,206 @@
+import numpy as np
+from kgraph.learner_layer.belief_state_engine import SmoothingEngine
+from kgraph.learner_layer.joint_state_engine import get_binary_entropy
+
+
+def get_link_free_knowledge_components(inference_model):
+    """
+    Return the KCs of the learner pool of an inference model that are neither the target nor the source of any gate.
+    :param inference_model: NoisyANDInferenceModel or NoisyORInferenceModel object
+    :return: list of KnowledgeComponent objects, in the order of the learner pool
+    """
+    knowledge_components = inference_model.associated_learner_pool.get_knowledge_components()
+    linked = set()
+    for kc in knowledge_components:
+        sources = [link[0] for link in inference_model.get_gate_links(kc)]
+        if sources:
+            linked.add(kc)
+            linked.update(sources)
+    return [kc for kc in knowledge_components if kc not in linked]
+
+
+class BKTEngine(SmoothingEngine):
+
+    def __init__(self, inference_model, knowledge_components=None):
+        """
+        Closed-form inference over the KCs of an inference model that have no prerequisite link, i.e. that are neither
+        the target nor the source of any gate: the chain of the nodes of such a KC is independent of the rest of the
+        network and reduces to Bayesian Knowledge Tracing, so that its mastering probability is carried forward with the
+        scalar BKT recursions. The belief state of a learner is the vector of the mastering probabilities of the KCs.
+        The posteriors are the ones of the JointStateEngine and of the unrolled dynamic bayesian network.
+        :param inference_model: NoisyANDInferenceModel or NoisyORInferenceModel, the model to be compiled
+        :param knowledge_components: list of KnowledgeComponent objects, KCs without prerequisite link -- defaults to
+        all the KCs without prerequisite link of the learner pool (see get_link_free_knowledge_components)
+        """
+        self.inference_model = inference_model
+        self.learner_pool = inference_model.associated_learner_pool
+        self.parameters_version = inference_model.get_parameters_version()
+        parameters = self.learner_pool.get_parameters()
+        if knowledge_components is None:
+            knowledge_components = get_link_free_knowledge_components(inference_model)
+        # in the order of the learner pool
+        knowledge_components = set(knowledge_components)
+        self.knowledge_components = [kc for kc in self.learner_pool.get_knowledge_components()
+                                     if kc in knowledge_components]
+        self.kc_axes = {kc: axis for axis, kc in enumerate(self.knowledge_components)}
+        self.n_kcs = len(self.knowledge_components)
+        self.pool_knowledge_components = self.knowledge_components
+        self.pool_kc_axes = np.arange(self.n_kcs)
+
+        self.priors = np.array([inference_model.get_initial_gate_input(kc) for kc in self.knowledge_components])
+        self.learns = np.array([parameters.get_learn(kc) for kc in self.knowledge_components])
+        self.forgets = np.array([parameters.get_forget(kc) for kc in self.knowledge_components])
+        # Emission tensor of every exercise: P(success=i | (kc)t=j)
+        self.answer_likelihoods = {}
+        for kc in self.knowledge_components:
+            for exercise in kc.get_exercises():
+                guess, slip = parameters.get_guess(exercise), parameters.get_slip(exercise)
+                self.answer_likelihoods[exercise] = np.array([[1 - guess, slip], [guess, 1 - slip]])
+
+    def get_compiled_arrays(self):
+        return [self.priors, self.learns, self.forgets]
+
+    def covers(self, knowledge_components):
+        """
+        Return whether all the given KCs are handled by the engine.
+        """
+        return all(kc in self.kc_axes for kc in knowledge_components)
+
+    def get_initial_belief_state(self):
+        """
+        Return the mastering probabilities of the KCs at time 0.
+        :return: np.array of shape (n_kcs,)
+        """
+        return self.priors.copy()
+
+    def _update_mastering_probabilities(self, m_pbas, axes, likelihoods):
+        """
+        BKT recursion: condition the mastering probabilities of the evaluated KCs on the answers, then apply learn and
+        forget.
+        :param m_pbas: np.array of shape (n,), the mastering probabilities of the evaluated KCs
+        :param axes: np.array of shape (n,), the axes of the evaluated KCs
+        :param likelihoods: np.array of shape (n, 2), the likelihood of each answer given the state of its KC
+        """
+        mastered = m_pbas * likelihoods[..., 1]
+        m_pbas = mastered / (mastered + (1 - m_pbas) * likelihoods[..., 0])
+        return m_pbas * (1 - self.forgets[axes]) + (1 - m_pbas) * self.learns[axes]
+
+    def update(self, belief, trace):
+        """
+        Carry a belief state forward through one learner trace (evidence, then transition) -- the traces of the KCs
+        that are not handled by the engine do not change it.
+        """
+        if trace.get_kc() not in self.kc_axes:
+            return belief
+        axis = self.kc_axes[trace.get_kc()]
+        belief = belief.copy()
+        belief[axis] = self._update_mastering_probabilities(
+            belief[axis], axis, self.get_answer_likelihood(trace.get_exercise(), trace.get_success()))
+        return belief
+
+    def update_batch(self, beliefs, learner_traces):
+        """
+        Carry the belief states of several learners forward through one trace each, as update does for one learner.
+        :param beliefs: list of np.array, the belief states of the learners
+        :param learner_traces: list of LearnerTrace objects, the trace of each learner
+        :return: np.array of shape (n_learners, n_kcs), the new belief states
+        """
+        beliefs = np.array(beliefs, dtype=float).reshape(len(learner_traces), self.n_kcs)
+        learners = np.array([i for i, trace in enumerate(learner_traces) if trace.get_kc() in self.kc_axes], dtype=int)
+        axes = np.array([self.kc_axes[learner_traces[i].get_kc()] for i in learners], dtype=int)
+        likelihoods = np.array([self.get_answer_likelihood(learner_traces[i].get_exercise(),
+                                                           learner_traces[i].get_success())
+                                for i in learners]).reshape(-1, 2)
+        beliefs[learners, axes] = self._update_mastering_probabilities(beliefs[learners, axes], axes, likelihoods)
+        return beliefs
+
+    def get_marginals(self, belief):
+        """
+        Return the mastering probability of every KC from a belief state.
+        :return: np.array of shape (..., n_kcs)
+        """
+        return belief
+
+    def get_marginal(self, belief, kc):
+        return belief[self.kc_axes[kc]]
+
+    def to_knowledge_states(self, belief):
+        """
+        Format a belief state as predict_learner_knowledge_states_from_learner_traces does.
+        :return: dict {f"{kc.id}": mastering probability}
+        """
+        return {f"{kc.id}": belief[axis] for axis, kc in enumerate(self.knowledge_components)}
+
+    def _get_initial_message(self):
+        # one backward message P(following answers | state) per KC
+        return np.ones((self.n_kcs, 2))
+
+    def _backward_step(self, message, trace):
+        if trace.get_kc() not in self.kc_axes:
+            return message
+        axis = self.kc_axes[trace.get_kc()]
+        learn, forget = self.learns[axis], self.forgets[axis]
+        kc_message = np.array([[1 - learn, learn], [forget, 1 - forget]]) @ message[axis]
+        kc_message *= self.get_answer_likelihood(trace.get_exercise(), trace.get_success())
+        message = message.copy()
+        message[axis] = kc_message / kc_message.sum()
+        return message
+
+    def _condition(self, belief, message):
+        mastered = belief * message[:, 1]
+        return mastered / (mastered + (1 - belief) * message[:, 0])
+
+    def score_exercises(self, belief, exercises=None):
+        """
+        Look one answer ahead: score every candidate exercise from a belief state, as
+        JointStateEngine.score_exercises does -- an answer only changes the mastering probability of its KC.
+        :param belief: np.array of shape (n_kcs,), the belief state of the learner
+        :param exercises: list of Exercise objects, the candidates -- defaults to all the exercises of the KCs
+        """
+        if exercises is None:
+            exercises = list(self.answer_likelihoods.keys())
+        axes = np.array([self.kc_axes[exercise.get_kc()] for exercise in exercises], dtype=int)
+        # likelihoods[j, answer, state of the evaluated KC]
+        likelihoods = np.array([self.answer_likelihoods[exercise] for exercise in exercises]).reshape(-1, 2, 2)
+        m_pbas = belief[axes]
+        state_pbas = np.stack((1 - m_pbas, m_pbas), axis=-1)
+        answer_pbas = np.einsum('jas,js->ja', likelihoods, state_pbas)
+        next_m_pbas = np.stack([self._update_mastering_probabilities(m_pbas, axes, likelihoods[:, answer])
+                                for answer in range(2)], axis=1)
+        mastering_pbas = np.repeat(np.broadcast_to(belief, (len(exercises), self.n_kcs))[:, np.newaxis], 2, axis=1)
+        mastering_pbas[np.arange(len(exercises)), :, axes] = next_m_pbas
+        information_gains = get_binary_entropy(answer_pbas[:, 1]) - np.einsum(
+            'js,js->j', state_pbas, get_binary_entropy(likelihoods[:, 1]))
+        return {
+            'success_probabilities': answer_pbas[:, 1],
+            'information_gains': information_gains,
+            'expected_mastery_changes': m_pbas * (1 - self.forgets[axes]) + (1 - m_pbas) * self.learns[axes] - m_pbas,
+            'mastering_probabilities': mastering_pbas,
+        }
+
+    def batch_filter(self, kc_axes, success_likelihoods, successes, mask, batch_size=1024):
+        """
+        Vectorized forward filtering over the padded traces of several learners, as JointStateEngine.batch_filter does
+        -- the axes of the KCs the engine does not handle being -1.
+        :return: np.array of shape (n_learners, n_steps+1, n_kcs), the i-th step of a learner taking into account its i
+        first traces -- nan after its last trace
+        """
+        n_learners, n_steps = mask.shape
+        likelihoods = np.where(successes[..., np.newaxis], success_likelihoods, 1 - success_likelihoods)
+        mastering_pbas = np.full((n_learners, n_steps + 1, self.n_kcs), np.nan)
+        for start in range(0, n_learners, batch_size):
+            stop = min(start + batch_size, n_learners)
+            beliefs = np.repeat(self.priors[np.newaxis], stop - start, axis=0)
+            mastering_pbas[start:stop, 0] = beliefs
+            for step in range(n_steps):
+                active = np.flatnonzero(mask[start:stop, step])
+                if len(active) == 0:
+                    break
+                # the traces on the KCs the engine does not handle leave the belief states unchanged
+                evaluated = active[kc_axes[start + active, step] >= 0]
+                axes = kc_axes[start + evaluated, step]
+                beliefs[evaluated, axes] = self._update_mastering_probabilities(beliefs[evaluated, axes], axes,
+                                                                                likelihoods[start + evaluated, step])
+                mastering_pbas[start + active, step + 1] = beliefs[active]
+        return mastering_pbas
+
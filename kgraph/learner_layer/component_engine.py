@@ -0,0 +1,228 @@
+import numpy as np
+import hashlib
+from kgraph.learner_layer.belief_state_engine import BeliefStateEngine
+from kgraph.learner_layer.bkt_engine import BKTEngine
+from kgraph.learner_layer.joint_state_engine import JointStateEngine, get_connected_components
+
+
+def get_linked_components(inference_model):
+    """
+    Return the connected components of the prerequisite graph of an inference model that hold at least one link.
+    :param inference_model: NoisyANDInferenceModel or NoisyORInferenceModel object
+    :return: list of lists of KnowledgeComponent objects, in the order of the learner pool
+    """
+    knowledge_components = inference_model.associated_learner_pool.get_knowledge_components()
+    components = get_connected_components(
+        knowledge_components, {kc: [link[0] for link in inference_model.get_gate_links(kc)]
+                               for kc in knowledge_components})
+    linked_components = {}
+    for kc in knowledge_components:
+        if len(components[kc]) > 1:
+            linked_components.setdefault(components[kc], []).append(kc)
+    return list(linked_components.values())
+
+
+class ComponentEngine(BeliefStateEngine):
+
+    def __init__(self, inference_model, bkt_engine=None):
+        """
+        Exact inference engine that splits the belief state of a learner along the connected components of the
+        prerequisite graph, whose KCs evolve independently of each other: the KCs without prerequisite link are handled
+        in closed form by a BKTEngine, and every linked component by its own JointStateEngine. The belief state is the
+        list of the belief states of these engines, so that the cost of an update grows as 2**n_kcs of the largest
+        linked component instead of 2**n_kcs of the learner pool. A trace moves the engines of the other components
+        through their gates only.
+        :param inference_model: NoisyANDInferenceModel or NoisyORInferenceModel, the model to be compiled
+        :param bkt_engine: BKTEngine object of the KCs without prerequisite link of the model -- compiled if not given
+        """
+        self.inference_model = inference_model
+        self.learner_pool = inference_model.associated_learner_pool
+        if bkt_engine is None:
+            bkt_engine = BKTEngine(inference_model)
+        # the one of the BKTEngine, taken before reading the parameters, so that an engine compiled during a change of
+        # the parameters is stale
+        self.parameters_version = bkt_engine.parameters_version
+        self.joint_state_engines = [JointStateEngine(inference_model, kcs)
+                                    for kcs in get_linked_components(inference_model)]
+        self.engines = ([bkt_engine] if bkt_engine.n_kcs > 0 else []) + self.joint_state_engines
+        self.knowledge_components = list(self.learner_pool.get_knowledge_components())
+        self.kc_axes = {kc: axis for axis, kc in enumerate(self.knowledge_components)}
+        self.n_kcs = len(self.knowledge_components)
+        self.pool_knowledge_components = self.knowledge_components
+        self.pool_kc_axes = np.arange(self.n_kcs)
+        self.max_joint_state_size = max((engine.n_kcs for engine in self.joint_state_engines), default=0)
+
+        # For each engine, the axes of its KCs in the order of its results (the order of the learner pool), and the axis
+        # in the engine of every KC of the learner pool (-1 for the KCs it does not handle)
+        self.engine_positions = [np.array([self.kc_axes[kc] for kc in engine.pool_knowledge_components], dtype=int)
+                                 for engine in self.engines]
+        self.engine_kc_axes = [np.array([engine.kc_axes.get(kc, -1) for kc in self.knowledge_components], dtype=int)
+                               for engine in self.engines]
+        self.kc_engines = {kc: i for i, engine in enumerate(self.engines) for kc in engine.knowledge_components}
+        self.answer_likelihoods = {}
+        for engine in self.engines:
+            self.answer_likelihoods.update(engine.answer_likelihoods)
+
+    def get_fingerprint(self):
+        """
+        Return a fingerprint of the compiled parameters of the engines, which identifies the belief states they compute
+        from given learner traces.
+        :return: str, the hexadecimal sha1 digest of the fingerprints of the engines
+        """
+        if getattr(self, '_fingerprint', None) is None:
+            fingerprint = hashlib.sha1()
+            for engine in self.engines:
+                fingerprint.update(engine.get_fingerprint().encode())
+            self._fingerprint = fingerprint.hexdigest()
+        return self._fingerprint
+
+    def covers(self, knowledge_components):
+        """
+        Return whether all the given KCs are handled by the engine.
+        """
+        return all(kc in self.kc_axes for kc in knowledge_components)
+
+    def get_initial_belief_state(self):
+        """
+        Return the belief state of a learner at time 0.
+        :return: list of the belief states of the engines
+        """
+        return [engine.get_initial_belief_state() for engine in self.engines]
+
+    def update(self, belief, trace):
+        """
+        Carry a belief state forward through one learner trace, every engine taking it into account.
+        """
+        return [engine.update(engine_belief, trace) for engine, engine_belief in zip(self.engines, belief)]
+
+    def update_batch(self, beliefs, learner_traces):
+        """
+        Carry the belief states of several learners forward through one trace each, as update does for one learner.
+        :param beliefs: list of the belief states of the learners
+        :param learner_traces: list of LearnerTrace objects, the trace of each learner
+        :return: list of the new belief states
+        """
+        engine_beliefs = [engine.update_batch([belief[i] for belief in beliefs], learner_traces)
+                          for i, engine in enumerate(self.engines)]
+        return [list(belief) for belief in zip(*engine_beliefs)]
+
+    def get_marginals(self, belief):
+        """
+        Return the mastering probability of every KC (in the order of the learner pool) from a belief state.
+        :return: np.array of shape (n_kcs,)
+        """
+        marginals = np.empty(self.n_kcs)
+        for engine, engine_belief, positions in zip(self.engines, belief, self.engine_positions):
+            marginals[positions] = engine.get_marginals(engine_belief)[engine.pool_kc_axes]
+        return marginals
+
+    def get_marginal(self, belief, kc):
+        """
+        Return the mastering probability of one KC from a belief state.
+        """
+        i = self.kc_engines[kc]
+        return self.engines[i].get_marginal(belief[i], kc)
+
+    def to_knowledge_states(self, belief):
+        """
+        Format a belief state as predict_learner_knowledge_states_from_learner_traces does.
+        :return: dict {f"{kc.id}": mastering probability}
+        """
+        return {f"{kc.id}": m_pba for kc, m_pba in zip(self.knowledge_components, self.get_marginals(belief))}
+
+    def score_exercises(self, belief, exercises=None):
+        """
+        Look one answer ahead: score every candidate exercise from a belief state, as
+        JointStateEngine.score_exercises does -- the candidates of a component are scored by its engine, the KCs of the
+        other components only going through their gates.
+        :param belief: list of the belief states of the engines
+        :param exercises: list of Exercise objects, the candidates -- defaults to all the exercises of the domain
+        """
+        if exercises is None:
+            exercises = list(self.answer_likelihoods.keys())
+        marginals = self.get_marginals(belief)
+        next_marginals = marginals.copy()
+        for engine, engine_belief, positions in zip(self.engines, belief, self.engine_positions):
+            if isinstance(engine, JointStateEngine):
+                next_marginals[positions] = engine.get_marginals(engine.transition(engine_belief, None))[
+                    engine.pool_kc_axes]
+        success_pbas, information_gains = np.empty(len(exercises)), np.empty(len(exercises))
+        mastery_changes = np.empty(len(exercises))
+        mastering_pbas = np.repeat(np.broadcast_to(next_marginals, (len(exercises), self.n_kcs))[:, np.newaxis], 2,
+                                   axis=1)
+        for i, (engine, engine_belief, positions) in enumerate(zip(self.engines, belief, self.engine_positions)):
+            exercise_positions = np.array([j for j, exercise in enumerate(exercises)
+                                           if self.kc_engines[exercise.get_kc()] == i], dtype=int)
+            if len(exercise_positions) == 0:
+                continue
+            scores = engine.score_exercises(engine_belief, [exercises[j] for j in exercise_positions])
+            success_pbas[exercise_positions] = scores['success_probabilities']
+            information_gains[exercise_positions] = scores['information_gains']
+            # the changes of the other components do not depend on the candidate
+            other_changes = (next_marginals - marginals).sum() - (next_marginals - marginals)[positions].sum()
+            mastery_changes[exercise_positions] = scores['expected_mastery_changes'] + other_changes
+            mastering_pbas[np.ix_(exercise_positions, [0, 1], positions)] = scores['mastering_probabilities']
+        return {
+            'success_probabilities': success_pbas,
+            'information_gains': information_gains,
+            'expected_mastery_changes': mastery_changes,
+            'mastering_probabilities': mastering_pbas,
+        }
+
+    def iter_filter_runs(self, learner_traces, min_run_length=8):
+        """
+        Forward filtering that carries the long runs of identical answers by the matrix of their update in every
+        JointStateEngine (see JointStateEngine.iter_filter_runs), the BKTEngine filtering in closed form.
+        :return: generator of the len(learner_traces)+1 belief states
+        """
+        learner_traces = list(learner_traces)
+        filters = [engine.iter_filter_runs(learner_traces, min_run_length) if isinstance(engine, JointStateEngine)
+                   else engine.iter_filter(learner_traces) for engine in self.engines]
+        for belief in zip(*filters):
+            yield list(belief)
+
+    def batch_filter(self, kc_axes, success_likelihoods, successes, mask, batch_size=1024):
+        """
+        Vectorized forward filtering over the padded traces of several learners, as JointStateEngine.batch_filter does,
+        engine by engine.
+        :return: np.array of shape (n_learners, n_steps+1, n_kcs) in the KC order of the learner pool
+        """
+        n_learners, n_steps = mask.shape
+        mastering_pbas = np.full((n_learners, n_steps + 1, self.n_kcs), np.nan)
+        for engine, engine_kc_axes, positions in zip(self.engines, self.engine_kc_axes, self.engine_positions):
+            mastering_pbas[..., positions] = engine.batch_filter(
+                np.where(kc_axes >= 0, engine_kc_axes[kc_axes], -1), success_likelihoods, successes, mask, batch_size)
+        return mastering_pbas
+
+    def smooth_with_lag(self, belief, learner_traces):
+        """
+        Condition a belief state on the learner traces that follow it.
+        :param belief: list of the belief states of the engines of a time slice given the previous traces
+        :param learner_traces: list of LearnerTrace objects, the traces from this time slice on
+        :return: list of the belief states of the engines of the time slice given all the traces
+        """
+        return [engine.smooth_with_lag(engine_belief, learner_traces)
+                for engine, engine_belief in zip(self.engines, belief)]
+
+    def smooth(self, learner_traces):
+        """
+        Forward-backward smoothing over a sequence of learner traces, as JointStateEngine.smooth does.
+        :return: (filtered, smoothed), two np.array of shape (len(learner_traces)+1, n_kcs) in the KC order of the
+        learner pool
+        """
+        filtered = np.empty((len(learner_traces) + 1, self.n_kcs))
+        smoothed = np.empty((len(learner_traces) + 1, self.n_kcs))
+        for engine, positions in zip(self.engines, self.engine_positions):
+            filtered[:, positions], smoothed[:, positions] = engine.smooth(learner_traces)
+        return filtered, smoothed
+
+    def fixed_lag_smooth(self, learner_traces, lag):
+        """
+        Fixed-lag smoothing over a sequence of learner traces, as JointStateEngine.fixed_lag_smooth does.
+        :return: np.array of shape (n_traces+1, n_kcs) in the KC order of the learner pool
+        """
+        learner_traces = list(learner_traces)
+        smoothed = np.empty((len(learner_traces) + 1, self.n_kcs))
+        for engine, positions in zip(self.engines, self.engine_positions):
+            smoothed[:, positions] = engine.fixed_lag_smooth(learner_traces, lag)
+        return smoothed
@@ -0,0 +1,163 @@
+import numpy as np
+from kgraph.learner_layer.belief_state_engine import BeliefStateEngine
+
+
+def get_kc_clusters_from_prerequisite_graph(inference_model, max_cluster_size=None, random_state=0):
+    """
+    Partition the knowledge components of an inference model into clusters of strongly linked KCs, using the Louvain
+    partition of the (undirected) graph of the gate links of the model.
+    :param inference_model: NoisyANDInferenceModel or NoisyORInferenceModel object
+    :param max_cluster_size: int, clusters bigger than this size are split (in topological order of the KCs)
+    :param random_state: int, the seed of the Louvain method, fixed so that the partition, hence the approximate
+    posteriors, are the same from one run to the other
+    :return: list of lists of KnowledgeComponent objects
+    """
+    import networkx as nx
+    from kgraph.helpers.network import cluster
+
+    engine = inference_model.get_joint_state_engine()
+    graph = nx.Graph()
+    graph.add_nodes_from(engine.knowledge_components)
+    for kc in engine.knowledge_components:
+        for source, _, _ in inference_model.get_gate_links(kc):
+            graph.add_edge(source, kc)
+    graph, labels = cluster(graph, verbose=0, random_state=random_state)
+    clusters = {}
+    for kc, label in zip(graph.nodes(), labels):
+        clusters.setdefault(label, []).append(kc)
+    clusters = [sorted(kcs, key=lambda kc: engine.kc_axes[kc]) for kcs in clusters.values()]
+    if max_cluster_size is not None:
+        clusters = [kcs[i:i + max_cluster_size] for kcs in clusters for i in range(0, len(kcs), max_cluster_size)]
+    return clusters
+
+
+class FactoredFrontierEngine(BeliefStateEngine):
+
+    def __init__(self, inference_model, clusters=None, max_cluster_size=None):
+        """
+        Approximate inference engine (Boyen-Koller projection) that keeps the belief state of a learner factored as a
+        product of joint distributions over clusters of KCs. Evidence and learn/forget are applied exactly inside the
+        cluster of the evaluated KC; at each gate, the sources that belong to another cluster are replaced by their
+        mastering probability. The memory and time of a step are linear in the number of KCs for a bounded cluster
+        size, which is the error/speed trade-off: one single cluster is exact inference, clusters of size 1 is the
+        fully factored approximation.
+        :param inference_model: NoisyANDInferenceModel or NoisyORInferenceModel, the model to be compiled
+        :param clusters: list of lists of KnowledgeComponent objects -- defaults to the Louvain partition of the
+        prerequisite graph
+        :param max_cluster_size: int, clusters bigger than this size are split
+        """
+        self.inference_model = inference_model
+        self.joint_state_engine = inference_model.get_joint_state_engine()
+        self.knowledge_components = self.joint_state_engine.knowledge_components
+        self.pool_knowledge_components = self.joint_state_engine.pool_knowledge_components
+        self.answer_likelihoods = self.joint_state_engine.answer_likelihoods
+        if clusters is None:
+            clusters = get_kc_clusters_from_prerequisite_graph(inference_model, max_cluster_size)
+        elif max_cluster_size is not None:
+            clusters = [kcs[i:i + max_cluster_size] for kcs in clusters for i in range(0, len(kcs), max_cluster_size)]
+        assert sorted(self.joint_state_engine.kc_axes[kc] for kcs in clusters for kc in kcs) == \
+            list(range(len(self.knowledge_components))), "Every KC must belong to exactly one cluster."
+        # inside a cluster, the KCs are kept in topological order
+        self.clusters = [sorted(kcs, key=lambda kc: self.joint_state_engine.kc_axes[kc]) for kcs in clusters]
+        self.kc_positions = {kc: (i, axis) for i, kcs in enumerate(self.clusters) for axis, kc in enumerate(kcs)}
+
+        # For each KC (in topological order), the einsum sublists that reduce its gate factor on the external sources
+        # and apply it to the tensor of its cluster
+        self.gate_operations = []
+        for kc, factor in zip(self.knowledge_components, self.joint_state_engine.gate_factors):
+            cluster, axis = self.kc_positions[kc]
+            n_axes = len(self.clusters[cluster])
+            sources = [link[0] for link in inference_model.get_gate_links(kc)]
+            internal_sources = [i for i, source in enumerate(sources) if self.kc_positions[source][0] == cluster]
+            external_sources = [i for i, source in enumerate(sources) if self.kc_positions[source][0] != cluster]
+            reduction_sublists = [[i + 1] for i in external_sources]
+            reduced_factor_sublist = [0, *[i + 1 for i in internal_sources], len(sources) + 1]
+            output_axes = [n_axes if i == axis else i for i in range(n_axes)]
+            self.gate_operations.append((
+                cluster, factor,
+                [self.kc_positions[sources[i]] for i in external_sources], reduction_sublists, reduced_factor_sublist,
+                (list(range(n_axes)),
+                 [axis, *[self.kc_positions[sources[i]][1] for i in internal_sources], n_axes],
+                 output_axes)))
+
+    def _get_kc_marginal(self, belief, kc_position):
+        cluster, axis = kc_position
+        tensor = belief[cluster]
+        marginal = tensor.sum(axis=tuple(i for i in range(tensor.ndim) if i != axis))
+        # normalized, so that a gate does not multiply its cluster by the rounding errors of the mass of another one
+        return marginal / marginal.sum()
+
+    def _apply_gates(self, gate_inputs):
+        belief = list(gate_inputs)
+        for cluster, factor, external_positions, reduction_sublists, reduced_factor_sublist, sublists in \
+                self.gate_operations:
+            operands = [factor, list(range(factor.ndim))]
+            for kc_position, sublist in zip(external_positions, reduction_sublists):
+                operands += [self._get_kc_marginal(belief, kc_position), sublist]
+            reduced_factor = np.einsum(*operands, reduced_factor_sublist)
+            belief_sublist, factor_sublist, output_sublist = sublists
+            belief[cluster] = np.einsum(belief[cluster], belief_sublist, reduced_factor, factor_sublist,
+                                        output_sublist)
+        return belief
+
+    def _apply_to_axis(self, belief, kc, matrix):
+        cluster, axis = self.kc_positions[kc]
+        belief = list(belief)
+        tensor = np.moveaxis(belief[cluster], axis, -1)
+        tensor = tensor @ matrix if matrix.ndim == 2 else tensor * matrix
+        belief[cluster] = np.moveaxis(tensor, -1, axis)
+        return belief
+
+    def get_initial_belief_state(self):
+        """
+        Return the factored belief state of the KC nodes at time 0.
+        :return: list of np.array, one joint distribution per cluster
+        """
+        gate_inputs = []
+        for kcs in self.clusters:
+            tensor = np.ones(())
+            for kc in kcs:
+                p_on = self.joint_state_engine.initial_gate_inputs[self.joint_state_engine.kc_axes[kc]]
+                tensor = np.multiply.outer(tensor, np.array([1 - p_on, p_on]))
+            gate_inputs.append(tensor)
+        return self._apply_gates(gate_inputs)
+
+    def observe(self, belief, trace):
+        """
+        Update a factored belief state with the evidence of a learner trace.
+        """
+        belief = self._apply_to_axis(belief, trace.get_kc(),
+                                     self.get_answer_likelihood(trace.get_exercise(), trace.get_success()))
+        cluster = self.kc_positions[trace.get_kc()][0]
+        belief[cluster] = belief[cluster] / belief[cluster].sum()
+        return belief
+
+    def transition(self, belief, evaluated_kc):
+        """
+        Move a factored belief state to the next time slice, the evaluated KC being subject to learn and forget.
+        """
+        engine = self.joint_state_engine
+        gate_inputs = self._apply_to_axis(belief, evaluated_kc,
+                                          engine.learn_forget_matrices[engine.kc_axes[evaluated_kc]])
+        return self._apply_gates(gate_inputs)
+
+    def update(self, belief, trace):
+        """
+        Carry a factored belief state forward through one learner trace (evidence, then transition).
+        """
+        return self.transition(self.observe(belief, trace), trace.get_kc())
+
+    def get_marginals(self, belief):
+        """
+        Return the mastering probability of every KC (in topological order) from a factored belief state.
+        :return: np.array of shape (n_kcs,)
+        """
+        return np.array([self._get_kc_marginal(belief, self.kc_positions[kc])[1] for kc in self.knowledge_components])
+
+    def to_knowledge_states(self, belief):
+        """
+        Format a factored belief state as predict_learner_knowledge_states_from_learner_traces does.
+        :return: dict {f"{kc.id}": mastering probability}
+        """
+        return {f"{kc.id}": self._get_kc_marginal(belief, self.kc_positions[kc])[1]
+                for kc in self.pool_knowledge_components}
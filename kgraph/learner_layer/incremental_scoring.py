@@ -0,0 +1,109 @@
+from kgraph.learner_layer.joint_state_engine import get_connected_components
+
+
+class IncrementalScorer(object):
+
+    def __init__(self, inference_model, batch_size=1024):
+        """
+        Keeps the predicted answers of many learners up to date with the parameters of an inference model and of its
+        learner pool, re-scoring at each update only the learners whose predictions depend on the parameters that have
+        changed since the last update.
+        The predicted answers of a learner only depend on the parameters of the connected components (of the
+        prerequisite graph) of the KCs it has been evaluated on, so that the changes are tracked per KC and per
+        exercise: a change of the prior or of the links (gates) of a KC re-scores the learners that have a trace on its
+        connected component, a change of the learn or forget of a KC the learners that have a trace on it, and a change
+        of the guess or slip of an exercise the learners that have answered it. The learners are found from inverted
+        indexes of the traces, without going through the others.
+        :param inference_model: NoisyANDInferenceModel or NoisyORInferenceModel object
+        :param batch_size: int, the number of learners whose belief states are held in memory at once when re-scoring
+        """
+        self.inference_model = inference_model
+        self.learner_pool = inference_model.associated_learner_pool
+        self.batch_size = batch_size
+        self.learner_traces = {}
+        self.scores = {}
+        # inverted indexes of the traces: {kc: set of learners}, {exercise: set of learners}
+        self.kc_learners, self.exercise_learners = {}, {}
+        self.dirty_learners = set()
+        # state of the parameters at the last update
+        self.parameters, self.gate_signatures = None, None
+        self.n_rescored = 0
+
+    def set_learner_traces(self, learner, learner_traces):
+        """
+        Set (or replace) the traces of a learner, which is re-scored at the next update.
+        :param learner: Learner object
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        """
+        self.remove_learner(learner)
+        self.learner_traces[learner] = list(learner_traces)
+        for trace in learner_traces:
+            self.kc_learners.setdefault(trace.get_kc(), set()).add(learner)
+            self.exercise_learners.setdefault(trace.get_exercise(), set()).add(learner)
+        self.dirty_learners.add(learner)
+
+    def remove_learner(self, learner):
+        if learner not in self.learner_traces:
+            return
+        for trace in self.learner_traces.pop(learner):
+            self.kc_learners[trace.get_kc()].discard(learner)
+            self.exercise_learners[trace.get_exercise()].discard(learner)
+        self.scores.pop(learner, None)
+        self.dirty_learners.discard(learner)
+
+    def get_gate_signatures(self):
+        """
+        Return, for every KC, the parameters of the model that define its gate: its initial gate input and its links.
+        :return: dict {kc: (initial gate input, tuple of the gate links)}
+        """
+        return {kc: (self.inference_model.get_initial_gate_input(kc), tuple(self.inference_model.get_gate_links(kc)))
+                for kc in self.learner_pool.get_knowledge_components()}
+
+    def get_dirty_learners(self):
+        """
+        Return the learners to be re-scored at the next update: the ones whose traces have been set since the last
+        update, and the ones whose predictions depend on the parameters that have changed since.
+        :return: set of Learner objects
+        """
+        return self._get_dirty_learners(self.learner_pool.get_parameters(), self.get_gate_signatures())
+
+    def _get_dirty_learners(self, parameters, gate_signatures):
+        dirty_learners = set(self.dirty_learners)
+        if self.parameters is None:
+            return dirty_learners | set(self.learner_traces)
+        changes = parameters.get_changes(self.parameters)
+        changed_gate_kcs = [kc for kc in gate_signatures if gate_signatures[kc] != self.gate_signatures.get(kc)]
+        if changed_gate_kcs:
+            # the components of the former and of the new links, which differ if links are added or removed
+            gate_sources = {kc: [link[0] for link in self.gate_signatures.get(kc, (None, ()))[1]] +
+                                [link[0] for link in gate_signatures[kc][1]] for kc in gate_signatures}
+            components = get_connected_components(list(gate_signatures), gate_sources)
+            for kc in set().union(*(components[kc] for kc in changed_gate_kcs)):
+                dirty_learners.update(self.kc_learners.get(kc, ()))
+        for kc in changes['learns'] | changes['forgets']:
+            dirty_learners.update(self.kc_learners.get(kc, ()))
+        for exercise in changes['slips'] | changes['guesses']:
+            dirty_learners.update(self.exercise_learners.get(exercise, ()))
+        return dirty_learners
+
+    def update(self):
+        """
+        Re-score the dirty learners (see get_dirty_learners) and return the predicted answers of all the learners.
+        :return: dict {learner: np.array of the probability to answer correctly each of its traces given the previous
+        ones}
+        """
+        # taken before scoring, so that the changes made meanwhile are seen at the next update
+        parameters, gate_signatures = self.learner_pool.get_parameters(), self.get_gate_signatures()
+        dirty_learners = list(self._get_dirty_learners(parameters, gate_signatures))
+        if dirty_learners:
+            predictions = self.inference_model.predict_learner_pool_answers(
+                [self.learner_traces[learner] for learner in dirty_learners], self.batch_size)
+            for learner, learner_predictions in zip(dirty_learners, predictions):
+                self.scores[learner] = learner_predictions[:len(self.learner_traces[learner])]
+        self.n_rescored += len(dirty_learners)
+        self.parameters, self.gate_signatures = parameters, gate_signatures
+        self.dirty_learners = set()
+        return self.scores
+
+    def get_scores(self):
+        return self.scores
@@ -0,0 +1,149 @@
+import pyAgrum as gum
+
+
+def get_option_setter_name(option):
+    """
+    Return the name of the setter of a pyAgrum inference engine that corresponds to an option, e.g. 'max_iter' gives
+    'setMaxIter'.
+    """
+    return 'set' + ''.join(word.capitalize() for word in option.split('_'))
+
+
+def unrolls_network(backend):
+    """
+    Return whether a backend runs an inference engine on the unrolled network (it has a make_inference_engine method),
+    rather than an engine compiled from the inference model (it has a get_engine method).
+    """
+    return hasattr(backend, 'make_inference_engine')
+
+
+def handles_joint_targets(backend):
+    """
+    Return whether the inference engines of a backend that unrolls the network handle joint targets -- False unless
+    the backend declares it.
+    """
+    return getattr(backend, 'handles_joint_targets', False)
+
+
+def handles_soft_evidences(backend):
+    """
+    Return whether the inference engines of a backend that unrolls the network handle soft evidences -- False unless
+    the backend declares it.
+    """
+    return getattr(backend, 'handles_soft_evidences', False)
+
+
+class PyAgrumInferenceBackend(object):
+    engine_class = None
+    handles_joint_targets = True
+    handles_soft_evidences = True
+    # the tuning options set when they are not given
+    default_options = {}
+
+    def __init__(self, **options):
+        """
+        Backend that runs a pyAgrum inference engine on the unrolled dynamic bayesian network.
+        :param options: the tuning options of the engine, each one being given to the corresponding setter of the
+        engine (e.g. max_iter=1000 calls setMaxIter(1000), max_time=.5 calls setMaxTime(.5), number_of_threads=4 calls
+        setNumberOfThreads(4)) -- on top of the default_options of the backend
+        """
+        for option in options:
+            assert hasattr(self.engine_class, get_option_setter_name(option)), \
+                f"Option {option} unknown for {self.engine_class.__name__}"
+        self.options = {**self.default_options, **options}
+
+    def make_inference_engine(self, bn):
+        """
+        Create the inference engine of an unrolled network, tuned with the options of the backend.
+        :param bn: gum.BayesNet object
+        """
+        ie = self.engine_class(bn)
+        for option, value in self.options.items():
+            getattr(ie, get_option_setter_name(option))(value)
+        return ie
+
+
+class LazyPropagationBackend(PyAgrumInferenceBackend):
+    engine_class = gum.LazyPropagation
+
+
+class ShaferShenoyBackend(PyAgrumInferenceBackend):
+    engine_class = gum.ShaferShenoyInference
+
+
+class WeightedSamplingBackend(PyAgrumInferenceBackend):
+    """
+    Approximate: likelihood weighting, the error decreasing with max_time (or epsilon). Gibbs sampling is not offered
+    since it does not mix through the deterministic AND/OR gates of the network, nor loopy belief propagation, whose
+    posteriors on the loops these gates make in the unrolled network are off by more than .5 whatever max_iter.
+    The sampling stops after max_time=1 second by default: its default stopping rule on epsilon may not be met in
+    reasonable time on an unrolled network.
+    """
+    engine_class = gum.WeightedSampling
+    handles_joint_targets = False
+    handles_soft_evidences = False
+    default_options = {'max_time': 1.}
+
+
+class JointStateBackend(object):
+
+    def __init__(self):
+        """
+        Backend that runs the exact engine compiled from the inference model, with one JointStateEngine per linked
+        component of the prerequisite graph (see InferenceModel.get_exact_engine).
+        """
+        self.options = {}
+
+    def get_engine(self, inference_model):
+        return inference_model.get_exact_engine()
+
+
+class FactoredFrontierBackend(object):
+
+    def __init__(self, clusters=None, max_cluster_size=None):
+        """
+        Backend that runs the approximate FactoredFrontierEngine compiled from the inference model.
+        :param clusters: list of lists of KnowledgeComponent objects -- defaults to the Louvain partition of the
+        prerequisite graph
+        :param max_cluster_size: int, the maximal number of KCs in a cluster, trading accuracy for speed
+        """
+        self.options = {'clusters': clusters, 'max_cluster_size': max_cluster_size}
+
+    def get_engine(self, inference_model):
+        return inference_model.get_factored_frontier_engine(**self.options)
+
+
+INFERENCE_BACKENDS = {
+    'pyagrum': LazyPropagationBackend,
+    'lazy_propagation': LazyPropagationBackend,
+    'shafer_shenoy': ShaferShenoyBackend,
+    'weighted_sampling': WeightedSamplingBackend,
+    'numpy': JointStateBackend,
+    'factored': FactoredFrontierBackend,
+}
+
+
+def register_inference_backend(name, backend_class):
+    """
+    Register a backend class so that it can be chosen by name. The backend does not need to subclass
+    PyAgrumInferenceBackend: the model only relies on the methods and attributes below.
+    :param name: str, the name of the backend
+    :param backend_class: class whose instances either have a make_inference_engine(bn) method returning a pyAgrum-like
+    inference engine (and may declare handles_joint_targets and handles_soft_evidences, False if not declared), or a
+    get_engine(inference_model) method returning a BeliefStateEngine; in both cases, an options dict of the keyword
+    arguments that rebuild the backend
+    """
+    INFERENCE_BACKENDS[name] = backend_class
+
+
+def get_inference_backend(backend, **options):
+    """
+    Return a backend instance from its name and tuning options.
+    :param backend: str, the name of a registered backend, or an already created backend (returned as is)
+    :param options: the tuning options of the backend
+    """
+    if not isinstance(backend, str):
+        assert not options, "Options can only be given with the name of a backend."
+        return backend
+    assert backend in INFERENCE_BACKENDS, f"Given backend {backend} unknown"
+    return INFERENCE_BACKENDS[backend](**options)
@@ -2,6 +2,18 @@ import pyAgrum as gum
 import pyAgrum.lib.notebook as gnb
 import pyAgrum.lib.dynamicBN as gdyn
 import numpy as np
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from kgraph.learner_layer.joint_state_engine import JointStateEngine, get_topological_order
+from kgraph.learner_layer.bkt_engine import BKTEngine
+from kgraph.learner_layer.component_engine import ComponentEngine, get_linked_components
+from kgraph.learner_layer.factored_frontier import FactoredFrontierEngine
+from kgraph.learner_layer.knowledge_state_frame import KnowledgeStateFrame
+from kgraph.learner_layer.inference_backends import get_inference_backend, unrolls_network, handles_joint_targets, \
+    handles_soft_evidences
+from kgraph.learner_layer.learner_pool_parameters import get_new_parameters_version
 
 
 def get_root_nodes(knowledge_components, link_strengths):
@@ -32,11 +44,887 @@ def unroll_2tbn(temp_bn, n_steps):
     return dbn
 
 
-class NoisyANDInferenceModel:
+def get_bn_fingerprint(bn):
+    """
+    Compute a fingerprint of a bayesian network that identifies its structure and its CPTs.
+    :param bn: gum.BayesNet object
+    :return: str, the hexadecimal sha1 digest of the nodes, arcs and CPTs of bn
+    """
+    fingerprint = hashlib.sha1()
+    for name in sorted(bn.names()):
+        cpt = bn.cpt(name)
+        fingerprint.update(repr((name, [cpt.variable(i).name() for i in range(cpt.nbrDim())])).encode())
+        fingerprint.update(cpt.toarray().tobytes())
+    return fingerprint.hexdigest()
 
-    def __init__(self, learner_pool, params):
+
+def set_joint_prior(bn, nodes, belief):
+    """
+    Replace the distribution of the KC nodes at time 0 of an unrolled network by a joint distribution, written as a
+    chain of CPTs P((kc_i)0 | (kc_0)0, ..., (kc_i-1)0).
+    :param bn: gum.BayesNet object, the unrolled network
+    :param nodes: list of the ids of the KC nodes at time 0, in the order of the axes of belief
+    :param belief: np.array of shape (2,)*len(nodes), the joint distribution
+    """
+    for i, node in enumerate(nodes):
+        former_parents = list(bn.parents(node))
+        for parent in former_parents:
+            bn.eraseArc(parent, node)
+        for parent in former_parents:
+            if not bn.children(parent):
+                bn.erase(parent)
+        for previous_node in nodes[:i]:
+            bn.addArc(previous_node, node)
+        marginal = belief.sum(axis=tuple(range(i + 1, len(nodes))))
+        normalization = marginal.sum(axis=-1, keepdims=True)
+        cpt = np.divide(marginal, normalization, out=np.full(marginal.shape, .5), where=normalization > 0)
+        # the first variable of a CPT varies the fastest, then its parents in the order of their arcs
+        bn.cpt(node).fillWith(np.transpose(cpt, [*range(i - 1, -1, -1), i]).flatten().tolist())
+
+
+def _predict_knowledge_states(inference_model, sequences, kwargs):
+    """
+    Infer the knowledge states of a chunk of learners, as a task of predict_learners_knowledge_states_from_learner_traces
+    run by an executor.
+    """
+    return [inference_model.predict_learner_knowledge_states_from_learner_traces(traces, **kwargs)
+            for traces in sequences]
+
+
+def get_joint_posterior(ie, bn, nodes):
+    """
+    Return the joint posterior of some nodes (declared as joint target of the inference) as a numpy array.
+    :param ie: gum inference engine on which the inference has been made
+    :param bn: gum.BayesNet object
+    :param nodes: list of node ids
+    :return: np.array of shape (2,)*len(nodes), with one axis per node in the order of nodes
+    """
+    posterior = ie.jointPosterior(set(nodes))
+    # the axes of toarray are the variables of the potential from the last to the first
+    names = [posterior.variable(i).name() for i in range(posterior.nbrDim())][::-1]
+    return np.transpose(posterior.toarray(), [names.index(bn.variable(node).name()) for node in nodes])
+
+
+class UnrolledDBNNodeIndex(object):
+
+    def __init__(self, bn, knowledge_components, n_steps):
+        """
+        Integer ids of the nodes of an unrolled network, resolved once per structure so that the exercise nodes, the
+        learn/forget CPTs and the evidences of the learner traces are set without formatting and looking up node names.
+        The ids hold for the copies of the network.
+        :param bn: gum.BayesNet object, the unrolled network
+        :param knowledge_components: list of KnowledgeComponent objects, the KCs of the network
+        :param n_steps: int, the number of time slices of the network
+        """
+        # keyed by the ids of the KCs, which name the nodes, so that the index holds for every model whose network has
+        # the same fingerprint, e.g. the copies of a model unpickled by the workers of a process pool
+        self.kc_positions = {kc.id: j for j, kc in enumerate(knowledge_components)}
+        # kc_nodes[i, j] is the node of the j-th KC at time slice i
+        self.kc_nodes = np.array([[bn.idFromName(f"({kc.id}){i}") for kc in knowledge_components]
+                                  for i in range(n_steps)], dtype=int).reshape(n_steps, len(knowledge_components))
+        # learn_forget_nodes[i, j] is the node Z[(kc)0->(kc)t] of the j-th KC at time slice i (-1 at time 0)
+        self.learn_forget_nodes = np.full(self.kc_nodes.shape, -1)
+        for i in range(1, n_steps):
+            self.learn_forget_nodes[i] = [bn.idFromName(f"(Z[({kc.id})0->({kc.id})t]){i}")
+                                          for kc in knowledge_components]
+        self.exercise_variables = {}
+
+    def get_kc_node(self, kc, i):
+        return int(self.kc_nodes[i, self.kc_positions[kc.id]])
+
+    def get_learn_forget_node(self, kc, i):
+        return int(self.learn_forget_nodes[i, self.kc_positions[kc.id]])
+
+    def get_exercise_variable(self, exercise, i):
+        """
+        Return the variable of the node of an exercise at time slice i, creating it at first call.
+        """
+        key = (exercise.id, i)
+        if key not in self.exercise_variables:
+            self.exercise_variables[key] = gum.LabelizedVariable(f"exercise({exercise.id}){i}",
+                                                                 f"exercise({exercise.id}){i}", 2)
+        return self.exercise_variables[key]
+
+
+class UnrolledDBNCache(object):
+
+    def __init__(self, maxsize=128):
+        """
+        Bounded LRU cache of unrolled dynamic bayesian networks, keyed by the fingerprint of the 2TBN they come from and
+        their number of time slices. Networks are returned as copies, so that the per-trace exercise nodes and the
+        learn/forget CPTs can be set without altering the cached network.
+        :param maxsize: int, the maximal number of unrolled networks kept in the cache
+        """
+        self.maxsize = maxsize
+        self.unrolled_bns = OrderedDict()
+        self.hits, self.misses = 0, 0
+        # the cache is shared by all the models, which may be used from several threads
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.unrolled_bns)
+
+    def get_unrolled_bn_and_node_index(self, temp_bn, n_steps, knowledge_components, fingerprint=None):
+        """
+        Return a copy of temp_bn unrolled over n_steps time slices and the UnrolledDBNNodeIndex of its nodes, both
+        being computed only if they are not in the cache.
+        :param temp_bn: gum.BayesNet object, the 2TBN to be unrolled
+        :param n_steps: int, the number of time slices
+        :param fingerprint: str, the fingerprint of temp_bn if already computed
+        :param knowledge_components: list of KnowledgeComponent objects, the KCs of temp_bn
+        :return: (gum.BayesNet object, UnrolledDBNNodeIndex object)
+        """
+        entry = self._get_entry(temp_bn, n_steps, fingerprint)
+        if entry[1] is None:
+            # built outside the lock too, a concurrent one being kept if any
+            node_index = UnrolledDBNNodeIndex(entry[0], knowledge_components, n_steps)
+            with self.lock:
+                if entry[1] is None:
+                    entry[1] = node_index
+        return gum.BayesNet(entry[0]), entry[1]
+
+    def _get_entry(self, temp_bn, n_steps, fingerprint):
+        key = (fingerprint if fingerprint is not None else get_bn_fingerprint(temp_bn), n_steps)
+        with self.lock:
+            if key in self.unrolled_bns:
+                self.hits += 1
+                self.unrolled_bns.move_to_end(key)
+                return self.unrolled_bns[key]
+            self.misses += 1
+        # unrolled outside the lock, so that a miss does not hold the threads that look up other networks; when several
+        # threads miss the same key, the first network inserted is kept and returned to all of them
+        entry = [unroll_2tbn(temp_bn, n_steps), None]
+        with self.lock:
+            entry = self.unrolled_bns.setdefault(key, entry)
+            self.unrolled_bns.move_to_end(key)
+            while len(self.unrolled_bns) > self.maxsize:
+                self.unrolled_bns.popitem(last=False)
+            return entry
+
+    def set_maxsize(self, maxsize):
+        with self.lock:
+            self.maxsize = maxsize
+            while len(self.unrolled_bns) > self.maxsize:
+                self.unrolled_bns.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.unrolled_bns.clear()
+            self.hits, self.misses = 0, 0
+
+    def get_hit_rate(self):
+        n_calls = self.hits + self.misses
+        return self.hits / n_calls if n_calls else 0.
+
+
+unrolled_dbn_cache = UnrolledDBNCache()
+
+
+class InferenceModel(object):
+    gate_type = None
+    # the maximal number of pruned 2TBNs kept by a model (see get_pruned_bn)
+    max_pruned_bns = 64
+    # the maximal number of KCs of the joint belief states of the exact filtering (see can_filter_exactly), whose size
+    # is 2**n_kcs of the largest linked component of the prerequisite graph
+    max_filtering_kcs = 16
+
+    def __init__(self, learner_pool, backend=None, gate_decomposition=None, evidence_mode='hard'):
+        """
+        State shared by the inference models: the caches of the unrolled and pruned networks and the compiled engines.
+        The subclasses set their link parameters, then build their 2TBN (see setup_dbn).
+        :param learner_pool: LearnerPool object
+        :param backend: str or backend object, the default inference backend of the model (see get_inference_backend)
+        :param gate_decomposition: str, None to connect all the inputs of a gate to its node, 'chain' or 'tree' to
+        decompose the gates with many inputs into a chain or a balanced tree of binary gates (see add_gate_inputs)
+        :param evidence_mode: str, 'hard' to observe the answers on per-trace exercise nodes, 'soft' to apply them as
+        likelihoods on the KC nodes (see get_unrolled_bn_with_evidences)
+        """
+        assert gate_decomposition in (None, 'chain', 'tree'), f"Given gate decomposition {gate_decomposition} unknown"
+        assert evidence_mode in ('hard', 'soft'), f"Given evidence mode {evidence_mode} unknown"
         self.associated_learner_pool = learner_pool
+        self.backend = backend
+        self.gate_decomposition = gate_decomposition
+        self.evidence_mode = evidence_mode
         self.bn = gum.BayesNet()
+        self.params_version = get_new_parameters_version()
+        self.unrolled_dbn_cache = unrolled_dbn_cache
+        self._bn_fingerprint = None
+        self._pruned_bns = OrderedDict()
+        self._pruned_bns_lock = threading.Lock()
+        self._joint_state_engine = None
+        self._bkt_engine = None
+        self._exact_engine = None
+        self._factored_frontier_engine, self._factored_frontier_options = None, (None, None)
+
+    def get_gate_links(self, kc):
+        """
+        Return the noisy links that enter the gate of kc's node.
+        :param kc: KnowledgeComponent object
+        :return: list of (source kc, P(Z=1|source mastered), P(Z=1|source not mastered)) tuples
+        """
+        raise NotImplementedError
+
+    def get_initial_gate_input(self, kc):
+        """
+        Return the probability that the node of kc is on at time 0 before its gate is applied.
+        :param kc: KnowledgeComponent object
+        :return: float
+        """
+        raise NotImplementedError
+
+    def has_prior_node(self, kc):
+        """
+        Return whether the node of kc at time 0 holds the prior of kc, rather than being the node of its gate.
+        :param kc: KnowledgeComponent object
+        """
+        raise NotImplementedError
+
+    def fill_prior_cpts(self, bn, kc_nodes, parameters):
+        """
+        Fill the CPTs of the KC nodes at time 0 that hold the priors of their KCs (see has_prior_node) with the priors
+        of a snapshot of the learner pool parameters.
+        :param bn: gum.BayesNet object
+        :param kc_nodes: dict {kc: id of the node of kc at time 0}
+        :param parameters: LearnerPoolParameters object
+        """
+        for kc, node in kc_nodes.items():
+            if self.has_prior_node(kc):
+                prior = parameters.get_prior(kc)
+                bn.cpt(node).fillWith([1 - prior, prior])
+
+    def add_gate_inputs(self, bn, gate_node, input_nodes):
+        """
+        Connect the inputs of a gate to its node, either directly or, if the model decomposes its gates, through a chain
+        or a balanced tree of binary gates of the same type, so that the CPTs (and the cliques of the unrolled network)
+        stay small whatever the number of inputs. AND and OR being associative, the decomposition is exact.
+        :param bn: gum.BayesNet object
+        :param gate_node: int, the id of the AND/OR node of the gate
+        :param input_nodes: list of int, the ids of the nodes that enter the gate
+        """
+        if self.gate_decomposition is None or len(input_nodes) <= 2:
+            for input_node in input_nodes:
+                bn.addArc(input_node, gate_node)
+            return
+        add_gate = bn.addAND if self.gate_type == 'AND' else bn.addOR
+        # the intermediate gates are named after the gate node and stay in its time slice
+        gate_name = bn.variable(gate_node).name()
+        n_gates = 0
+
+        def _add_binary_gate(first_node, second_node):
+            nonlocal n_gates
+            name = f"(G{n_gates}{gate_name[:-1]}){gate_name[-1]}"
+            n_gates += 1
+            binary_gate_node = add_gate(gum.LabelizedVariable(name, name, 2))
+            bn.addArc(first_node, binary_gate_node)
+            bn.addArc(second_node, binary_gate_node)
+            return binary_gate_node
+
+        if self.gate_decomposition == 'chain':
+            last_inputs = [input_nodes[0]]
+            for input_node in input_nodes[1:-1]:
+                last_inputs = [_add_binary_gate(last_inputs[0], input_node)]
+            last_inputs.append(input_nodes[-1])
+        else:
+            last_inputs = list(input_nodes)
+            while len(last_inputs) > 2:
+                last_inputs = [_add_binary_gate(*last_inputs[i:i + 2]) if i + 1 < len(last_inputs) else last_inputs[i]
+                               for i in range(0, len(last_inputs), 2)]
+        for input_node in last_inputs:
+            bn.addArc(input_node, gate_node)
+
+    def get_bn_fingerprint(self):
+        """
+        Return the fingerprint of the model's 2TBN, computing it at first call.
+        """
+        if self._bn_fingerprint is None:
+            self._bn_fingerprint = get_bn_fingerprint(self.bn)
+        return self._bn_fingerprint
+
+    def get_topological_order(self):
+        """
+        Return the KCs of the learner pool in the order of the axes of the JointStateEngine: every source of a gate
+        comes before the KC of the gate.
+        """
+        knowledge_components = self.associated_learner_pool.get_knowledge_components()
+        return get_topological_order(knowledge_components, {kc: [link[0] for link in self.get_gate_links(kc)]
+                                                            for kc in knowledge_components})
+
+    def get_relevant_knowledge_components(self, learner_traces, targets):
+        """
+        Return the KCs whose nodes are needed to infer the posteriors of the targets given the learner traces: the
+        ancestors (by the sources of the gates) of the targets and of the evaluated KCs, minus the ones that are
+        d-separated from the targets. The other nodes of the unrolled network are barren or independent of the targets
+        and can be pruned without changing their posteriors.
+        :param learner_traces: list of LearnerTrace objects
+        :param targets: list of KnowledgeComponent objects, the KCs whose posteriors are queried
+        :return: list of KnowledgeComponent objects, in the order of the learner pool
+        """
+        sources = {kc: [link[0] for link in self.get_gate_links(kc)]
+                   for kc in self.associated_learner_pool.get_knowledge_components()}
+        ancestors, to_visit = set(), list(targets) + [trace.get_kc() for trace in learner_traces]
+        while to_visit:
+            kc = to_visit.pop()
+            if kc not in ancestors:
+                ancestors.add(kc)
+                to_visit.extend(sources[kc])
+        # no KC node is observed: the KCs d-connected to the targets are the ones of their connected component
+        neighbours = {kc: set() for kc in ancestors}
+        for kc in ancestors:
+            for source in sources[kc]:
+                neighbours[kc].add(source)
+                neighbours[source].add(kc)
+        relevant, to_visit = set(), list(targets)
+        while to_visit:
+            kc = to_visit.pop()
+            if kc not in relevant:
+                relevant.add(kc)
+                to_visit.extend(neighbours[kc])
+        return [kc for kc in self.associated_learner_pool.get_knowledge_components() if kc in relevant]
+
+    def get_pruned_bn(self, knowledge_components):
+        """
+        Return the 2TBN of the model restricted to some KCs (and its fingerprint), building it if it is not among the
+        max_pruned_bns last used ones.
+        :param knowledge_components: list of KnowledgeComponent objects, containing the sources of their gates
+        """
+        key = frozenset(knowledge_components)
+        with self._pruned_bns_lock:
+            if key in self._pruned_bns:
+                self._pruned_bns.move_to_end(key)
+                return self._pruned_bns[key]
+            params_version = self.params_version
+        # built outside the lock, as in UnrolledDBNCache, the first 2TBN inserted being kept; one built while the
+        # parameters were refreshed is returned without being cached
+        bn = gum.BayesNet()
+        self.setup_dbn(knowledge_components, bn)
+        pruned_bn = (bn, get_bn_fingerprint(bn))
+        with self._pruned_bns_lock:
+            if self.params_version != params_version:
+                return pruned_bn
+            pruned_bn = self._pruned_bns.setdefault(key, pruned_bn)
+            self._pruned_bns.move_to_end(key)
+            while len(self._pruned_bns) > self.max_pruned_bns:
+                self._pruned_bns.popitem(last=False)
+            return pruned_bn
+
+    def set_max_pruned_bns(self, max_pruned_bns):
+        with self._pruned_bns_lock:
+            self.max_pruned_bns = max_pruned_bns
+            while len(self._pruned_bns) > self.max_pruned_bns:
+                self._pruned_bns.popitem(last=False)
+
+    def get_link_parameters(self):
+        """
+        Return the parameters of every link of the model.
+        :return: dict {(source, target): tuple of the parameters of the link}, source and target being the keys of the
+        link in the parameters of the model
+        """
+        raise NotImplementedError
+
+    def fill_link_cpts(self, bn, links):
+        """
+        Fill the CPTs of the Z nodes of some links of a 2TBN of the model with the current parameters of the model.
+        :param bn: gum.BayesNet object, a 2TBN built by setup_dbn -- the nodes of the links it does not contain are
+        ignored
+        :param links: list of (source, target) tuples, as in get_link_parameters
+        """
+        raise NotImplementedError
+
+    def _set_link_parameters(self, params):
+        raise NotImplementedError
+
+    def refresh_parameters(self, params):
+        """
+        Replace the link parameters of the model, rewriting in place the CPTs of the links whose parameters change in
+        the 2TBN of the model and in its pruned ones, instead of building a new model: the structure is kept, and the
+        compiled engines are recompiled at their next use.
+        :param params: the link parameters, in the format of the constructor of the model
+        """
+        former_link_parameters = self.get_link_parameters()
+        self._set_link_parameters(params)
+        link_parameters = self.get_link_parameters()
+        changed_links = [link for link in link_parameters if link_parameters[link] != former_link_parameters.get(link)]
+        if not changed_links:
+            return
+        self.fill_link_cpts(self.bn, changed_links)
+        with self._pruned_bns_lock:
+            for key, (bn, _) in self._pruned_bns.items():
+                self.fill_link_cpts(bn, changed_links)
+                self._pruned_bns[key] = (bn, get_bn_fingerprint(bn))
+            # under the lock, so that get_pruned_bn does not cache a 2TBN built with the former parameters
+            self.params_version = get_new_parameters_version()
+        self._bn_fingerprint = None
+        self._reset_compiled_engines()
+
+    def get_unrolled_bn_with_evidences(self, learner_traces, initial_belief=None, knowledge_components=None):
+        """
+        Unroll the dynamic bayesian network over the learner traces and introduce their evidences: with the 'hard'
+        evidence mode, one exercise node per trace observed as the answer; with the 'soft' one, the likelihood of the
+        answer on the node of the evaluated KC, which gives the same posteriors without adding nodes.
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :param initial_belief: np.array, a joint distribution over the KC nodes at time 0 (with axes in the order of
+        the JointStateEngine) that replaces their prior
+        :param knowledge_components: list of KnowledgeComponent objects, the KCs kept in the network (see
+        get_relevant_knowledge_components) -- defaults to all the KCs
+        :return: (bn, evidences, node_index), the unrolled gum.BayesNet, the dict of its evidences (by node id) and the
+        UnrolledDBNNodeIndex of its nodes
+        """
+        if knowledge_components is None:
+            temp_bn, fingerprint = self.bn, self.get_bn_fingerprint()
+            knowledge_components = self.get_topological_order()
+        else:
+            temp_bn, fingerprint = self.get_pruned_bn(knowledge_components)
+            knowledge_components = [kc for kc in self.get_topological_order() if kc in knowledge_components]
+        # the parameters are pinned for the whole inference
+        pool = self.associated_learner_pool.get_parameters()
+        bn, node_index = self.unrolled_dbn_cache.get_unrolled_bn_and_node_index(
+            temp_bn, len(learner_traces)+1, knowledge_components, fingerprint)
+        if initial_belief is not None:
+            set_joint_prior(bn, node_index.kc_nodes[0].tolist(), initial_belief)
+        else:
+            # the priors of the 2TBN are the ones of the parameters at the time it was built
+            self.fill_prior_cpts(bn, {kc: node_index.get_kc_node(kc, 0) for kc in knowledge_components}, pool)
+        # Setup the evidences of the answers, and the learn/forget CPTs of the evaluated KCs
+        evidences = {}
+        for i, trace in enumerate(learner_traces):
+            evaluated_kc = trace.get_kc()
+            if evaluated_kc.id not in node_index.kc_positions:
+                continue
+            exercise = trace.get_exercise()
+            guess, slip = pool.get_guess(exercise), pool.get_slip(exercise)
+            learn, forget = pool.get_learn(evaluated_kc), pool.get_forget(evaluated_kc)
+
+            kc_node = node_index.get_kc_node(evaluated_kc, i)
+            if self.evidence_mode == 'soft':
+                # P(answer | kc not mastered), P(answer | kc mastered)
+                evidences[kc_node] = [guess, 1 - slip] if trace.get_success() else [1 - guess, slip]
+            else:
+                exercise_node = bn.add(node_index.get_exercise_variable(exercise, i))
+                bn.addArc(kc_node, exercise_node)
+                # the first variable of a CPT varies the fastest, then its parents
+                bn.cpt(exercise_node).fillWith([1 - guess, guess, slip, 1 - slip])
+                evidences[exercise_node] = int(trace.get_success())
+            bn.cpt(node_index.get_learn_forget_node(evaluated_kc, i+1)).fillWith([1 - learn, learn, forget, 1 - forget])
+        return bn, evidences, node_index
+
+    def get_inference_backend(self, backend=None):
+        """
+        Return the inference backend to be used: the given one, else the one of the model, else the one of the learner
+        pool, else LazyPropagation.
+        :param backend: str, the name of a registered backend (see kgraph.learner_layer.inference_backends), or a
+        backend object created by get_inference_backend with its tuning options
+        """
+        for candidate in (backend, self.backend, self.associated_learner_pool.get_inference_backend()):
+            if candidate is not None:
+                return get_inference_backend(candidate)
+        return get_inference_backend('pyagrum')
+
+    def predict_learner_knowledge_states_from_learner_traces(self, learner_traces, backend=None, window=None, lag=0,
+                                                             targets=None):
+        """
+        Infer the knowledge state of a learner after a sequence of learner traces.
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :param backend: str or backend object, the inference backend (see get_inference_backend) -- pyAgrum backends
+        unroll the dynamic bayesian network and run their inference engine on it, 'numpy' runs the exact
+        engine (see get_exact_engine), 'factored' runs the approximate FactoredFrontierEngine
+        :param window: int, with a pyAgrum backend, the maximal number of traces of an unrolled network -- the
+        traces are processed by windows, the joint posterior of the last time slice of a window being the prior of
+        the next one, so that the memory does not depend on the number of traces
+        :param lag: int, the knowledge state is the one before the lag last traces, given all the traces (fixed-lag
+        smoothing) -- must not exceed window
+        :param targets: list of KnowledgeComponent objects, the KCs whose mastering probabilities are queried --
+        defaults to all the KCs; with a pyAgrum backend, the nodes that are not relevant to the targets are pruned
+        from the unrolled network
+        :return: dict {f"{kc.id}": mastering probability}
+        """
+        backend = self.get_inference_backend(backend)
+        assert 0 <= lag <= len(learner_traces), "lag must be between 0 and the number of traces."
+        if not unrolls_network(backend):
+            engine = backend.get_engine(self)
+            if lag == 0:
+                knowledge_states = engine.to_knowledge_states(engine.predict(learner_traces))
+            else:
+                assert hasattr(engine, 'smooth_with_lag'), "Smoothing is not handled by this backend."
+                belief = engine.predict(learner_traces[:len(learner_traces)-lag])
+                knowledge_states = engine.to_knowledge_states(
+                    engine.smooth_with_lag(belief, learner_traces[len(learner_traces)-lag:]))
+            if targets is not None:
+                knowledge_states = {f"{kc.id}": knowledge_states[f"{kc.id}"] for kc in targets}
+            return knowledge_states
+
+        knowledge_components = self.associated_learner_pool.get_knowledge_components() if targets is None else targets
+        # the KCs without prerequisite link are inferred in closed form, and pruned from the unrolled network
+        bkt_engine = self.get_bkt_engine()
+        knowledge_states = {}
+        if any(kc in bkt_engine.kc_axes for kc in knowledge_components):
+            belief = bkt_engine.predict(learner_traces[:len(learner_traces)-lag])
+            if lag > 0:
+                belief = bkt_engine.smooth_with_lag(belief, learner_traces[len(learner_traces)-lag:])
+            bkt_knowledge_states = bkt_engine.to_knowledge_states(belief)
+            knowledge_states = {f"{kc.id}": bkt_knowledge_states[f"{kc.id}"] for kc in knowledge_components
+                                if kc in bkt_engine.kc_axes}
+            targets = [kc for kc in knowledge_components if kc not in bkt_engine.kc_axes]
+            if not targets:
+                return knowledge_states
+        assert self.evidence_mode == 'hard' or handles_soft_evidences(backend), \
+            "The soft evidence mode is not handled by this backend."
+        if window is None:
+            knowledge_states.update(self._infer_knowledge_states(learner_traces, backend, targets, None, lag))
+        else:
+            assert window >= 1, "window must be positive."
+            assert lag <= window, "lag must not exceed window."
+            assert handles_joint_targets(backend), "Windows need a backend that handles joint targets."
+            # the linked components are folded separately, so that the joint posteriors carried from a window to the
+            # next one do not span KCs that are independent of each other
+            targets = set(targets if targets is not None else knowledge_components)
+            for component in get_linked_components(self):
+                component_targets = [kc for kc in component if kc in targets]
+                if component_targets:
+                    knowledge_states.update(self._infer_knowledge_states(learner_traces, backend, component_targets,
+                                                                         window, lag))
+        return {f"{kc.id}": knowledge_states[f"{kc.id}"] for kc in knowledge_components}
+
+    def _infer_knowledge_states(self, learner_traces, backend, targets, window, lag):
+        """
+        Infer the mastering probabilities of some KCs with a pyAgrum backend (see
+        predict_learner_knowledge_states_from_learner_traces), the network being pruned to the KCs relevant to them.
+        :param targets: list of KnowledgeComponent objects -- None for all the KCs, without pruning
+        :return: dict {f"{kc.id}": mastering probability} of the targets
+        """
+        kept_knowledge_components = None
+        if targets is not None:
+            kept_knowledge_components = self.get_relevant_knowledge_components(learner_traces, targets)
+        initial_belief = None
+        if window is not None:
+            while len(learner_traces) > window:
+                n_folded = min(window, len(learner_traces) - window)
+                bn, evidences, node_index = self.get_unrolled_bn_with_evidences(
+                    learner_traces[:n_folded], initial_belief, kept_knowledge_components)
+                ie = backend.make_inference_engine(bn)
+                ie.setEvidence(evidences)
+                slice_nodes = node_index.kc_nodes[n_folded].tolist()
+                ie.addJointTarget(set(slice_nodes))
+                ie.makeInference()
+                initial_belief = get_joint_posterior(ie, bn, slice_nodes)
+                learner_traces = learner_traces[n_folded:]
+        bn, evidences, node_index = self.get_unrolled_bn_with_evidences(learner_traces, initial_belief,
+                                                                        kept_knowledge_components)
+        # Setup the inference
+        ie = backend.make_inference_engine(bn)
+        ie.setEvidence(evidences)
+        ie.makeInference()
+        if targets is None:
+            targets = self.associated_learner_pool.get_knowledge_components()
+        return {f"{kc.id}": ie.posterior(node_index.get_kc_node(kc, len(learner_traces)-lag))[1] for kc in targets}
+
+    def predict_learners_knowledge_states_from_learner_traces(self, learner_traces, executor=None, n_threads=None,
+                                                              chunksize=None, **kwargs):
+        """
+        Infer the knowledge states of several learners, one after the other in the calling process, or concurrently on
+        an executor of the caller. pyAgrum inferences hold the GIL, and the unrolled networks are built in Python, so
+        that only a process pool runs them in parallel: the model and the traces are then pickled to the workers,
+        without the caches of the model, which each worker rebuilds (see InferenceModel.__getstate__). Reusing the pool
+        across calls amortizes the start of its workers; a pool started with spawn or forkserver is safer than one
+        started with fork, which may deadlock when another thread of the calling process holds a lock.
+        :param learner_traces: dict {learner: list of LearnerTrace objects} or list of lists of LearnerTrace objects
+        :param executor: concurrent.futures.Executor object, e.g. ProcessPoolExecutor(4,
+        multiprocessing.get_context('forkserver')) -- None to run the inferences in the calling process
+        :param n_threads: int, with a pyAgrum backend, the number of threads of each inference
+        :param chunksize: int, with an executor, the number of learners of a task, the model being pickled once per
+        task -- defaults to 4 tasks per CPU
+        :param kwargs: the other arguments of predict_learner_knowledge_states_from_learner_traces (backend, window,
+        lag, targets)
+        :return: the knowledge state (dict {f"{kc.id}": mastering probability}) of each learner, as a dict {learner:
+        knowledge state} if learner_traces is a dict, else as a list
+        """
+        backend = self.get_inference_backend(kwargs.pop('backend', None))
+        if n_threads is not None:
+            assert unrolls_network(backend), "n_threads is only handled by backends that unroll the network."
+            backend = type(backend)(**{**backend.options, 'number_of_threads': n_threads})
+        kwargs['backend'] = backend
+        sequences = list(learner_traces.values()) if isinstance(learner_traces, dict) else list(learner_traces)
+        if executor is None:
+            knowledge_states = _predict_knowledge_states(self, sequences, kwargs)
+        else:
+            if chunksize is None:
+                chunksize = max(1, int(np.ceil(len(sequences) / (4 * (os.cpu_count() or 1)))))
+            futures = [executor.submit(_predict_knowledge_states, self, sequences[i:i+chunksize], kwargs)
+                       for i in range(0, len(sequences), chunksize)]
+            knowledge_states = [states for future in futures for states in future.result()]
+        if isinstance(learner_traces, dict):
+            return dict(zip(learner_traces.keys(), knowledge_states))
+        return knowledge_states
+
+    def get_parameters_version(self):
+        """
+        Return the version of the parameters of the model: the one of the snapshot of the learner pool parameters and
+        the one of the link parameters of the model.
+        """
+        return self.associated_learner_pool.get_parameters_version(), self.params_version
+
+    def get_joint_state_engine(self):
+        """
+        Return the JointStateEngine compiled from the model, compiling it at first call and whenever the parameters
+        of the model or of its learner pool have changed since it was compiled.
+        """
+        engine = self._joint_state_engine
+        if engine is None or engine.parameters_version != self.get_parameters_version():
+            engine = JointStateEngine(self)
+            self._joint_state_engine = engine
+        return engine
+
+    def get_bkt_engine(self):
+        """
+        Return the BKTEngine of the KCs of the model without prerequisite link, compiling it at first call and whenever
+        the parameters of the model or of its learner pool have changed since it was compiled.
+        """
+        engine = self._bkt_engine
+        if engine is None or engine.parameters_version != self.get_parameters_version():
+            engine = BKTEngine(self)
+            self._bkt_engine = engine
+        return engine
+
+    def get_exact_engine(self):
+        """
+        Return the engine of exact inference of the model: the closed-form BKTEngine if no KC of the learner pool has
+        prerequisite links, else the ComponentEngine, with one JointStateEngine per linked component of the
+        prerequisite graph. It is compiled at first call and whenever the parameters of the model or of its learner pool
+        have changed since it was compiled.
+        """
+        bkt_engine = self.get_bkt_engine()
+        if bkt_engine.covers(self.associated_learner_pool.get_knowledge_components()):
+            return bkt_engine
+        engine = self._exact_engine
+        if engine is None or engine.parameters_version != self.get_parameters_version():
+            engine = ComponentEngine(self, bkt_engine)
+            self._exact_engine = engine
+        return engine
+
+    def can_filter_exactly(self, learner_traces):
+        """
+        Return whether the exact engine carries the belief state of a learner forward through learner traces in
+        reasonable time and memory: with the closed-form BKTEngine, or with JointStateEngines of at most
+        max_filtering_kcs KCs. Beyond, the cost of an update doubles with each KC of the largest linked component, and
+        unrolling the network is faster.
+        :param learner_traces: list of LearnerTrace objects
+        """
+        if self.get_bkt_engine().covers(trace.get_kc() for trace in learner_traces):
+            return True
+        return self.get_exact_engine().max_joint_state_size <= self.max_filtering_kcs
+
+    def get_filtering_engine(self, backend=None):
+        """
+        Return the engine that carries the belief states of the learners forward one trace at a time: the one of the
+        backend if it has one (e.g. 'factored'), else the exact engine (see get_exact_engine).
+        :param backend: str or backend object, the inference backend (see get_inference_backend)
+        """
+        backend = self.get_inference_backend(backend)
+        if unrolls_network(backend):
+            return self.get_exact_engine()
+        return backend.get_engine(self)
+
+    def get_factored_frontier_engine(self, clusters=None, max_cluster_size=None):
+        """
+        Return the FactoredFrontierEngine of the model, compiling it if it does not exist or if clusters or
+        max_cluster_size are given and differ from the ones of the existing engine.
+        :param clusters: list of lists of KnowledgeComponent objects -- defaults to the Louvain partition of the
+        prerequisite graph
+        :param max_cluster_size: int, the maximal number of KCs in a cluster, trading accuracy for speed
+        """
+        options = (None if clusters is None else tuple(tuple(kcs) for kcs in clusters), max_cluster_size)
+        if self._factored_frontier_engine is None or \
+                self._factored_frontier_engine.joint_state_engine is not self.get_joint_state_engine() or \
+                (options != (None, None) and options != self._factored_frontier_options):
+            self._factored_frontier_engine = FactoredFrontierEngine(self, clusters, max_cluster_size)
+            self._factored_frontier_options = options
+        return self._factored_frontier_engine
+
+    def __getstate__(self):
+        """
+        Pickle the model without its caches, its lock and its compiled engines, which are rebuilt at their next use
+        (e.g. by the workers of predict_learners_knowledge_states_from_learner_traces).
+        """
+        state = dict(self.__dict__)
+        for name in ('unrolled_dbn_cache', '_pruned_bns', '_pruned_bns_lock', '_joint_state_engine', '_bkt_engine',
+                     '_exact_engine', '_factored_frontier_engine'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.unrolled_dbn_cache = unrolled_dbn_cache
+        self._pruned_bns = OrderedDict()
+        self._pruned_bns_lock = threading.Lock()
+        self._reset_compiled_engines()
+
+    def _reset_compiled_engines(self):
+        self._joint_state_engine = None
+        self._bkt_engine = None
+        self._exact_engine = None
+        self._factored_frontier_engine = None
+
+    def predict_learner_knowledge_trajectory(self, learner_traces, filtered=False, backend=None):
+        """
+        Infer in a single inference the mastering probability of every KC at every time slice, given all the traces.
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :param filtered: bool, whether the filtered estimates (the i-th one given the i first traces) are returned too
+        :param backend: str or backend object, the inference backend (see get_inference_backend) -- pyAgrum backends
+        read the posteriors of every (kc)t node of one inference on the unrolled network, 'numpy' runs the
+        forward-backward algorithm of the exact engine (see get_exact_engine); the filtered estimates always come from
+        the exact engine
+        :return: np.array of shape (len(learner_traces)+1, n_kcs) of the smoothed mastering probabilities, with KCs in
+        the order of the learner pool -- and the array of the filtered ones if filtered
+        """
+        backend = self.get_inference_backend(backend)
+        if not unrolls_network(backend):
+            assert hasattr(backend.get_engine(self), 'smooth'), "Smoothing is not handled by this backend."
+            filtered_trajectory, smoothed_trajectory = backend.get_engine(self).smooth(learner_traces)
+            return (smoothed_trajectory, filtered_trajectory) if filtered else smoothed_trajectory
+
+        assert self.evidence_mode == 'hard' or handles_soft_evidences(backend), \
+            "The soft evidence mode is not handled by this backend."
+        knowledge_components = self.associated_learner_pool.get_knowledge_components()
+        bn, evidences, node_index = self.get_unrolled_bn_with_evidences(learner_traces)
+        ie = backend.make_inference_engine(bn)
+        ie.setEvidence(evidences)
+        ie.makeInference()
+        smoothed_trajectory = np.array([
+            [ie.posterior(node_index.get_kc_node(kc, i))[1] for kc in knowledge_components]
+            for i in range(len(learner_traces) + 1)])
+        if filtered:
+            engine = self.get_exact_engine()
+            filtered_trajectory = np.array([engine.get_marginals(belief)[engine.pool_kc_axes]
+                                            for belief in engine.iter_filter(learner_traces)])
+            return smoothed_trajectory, filtered_trajectory
+        return smoothed_trajectory
+
+    def fixed_lag_smooth_learner_knowledge_states_from_learner_traces(self, learner_traces, lag):
+        """
+        Fixed-lag smoothing of the knowledge states of a learner with the exact engine (see get_exact_engine), with a
+        memory that does not depend on the number of traces.
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :param lag: int, the number of following traces taken into account for each time slice
+        :return: list of len(learner_traces)+1 dicts {f"{kc.id}": mastering probability}, the i-th one being the
+        mastering probabilities at time slice i given the i+lag first traces
+        """
+        engine = self.get_exact_engine()
+        smoothed = engine.fixed_lag_smooth(learner_traces, lag)
+        return [{f"{kc.id}": pbas[i] for i, kc in enumerate(engine.pool_knowledge_components)} for pbas in smoothed]
+
+    def smooth_learner_knowledge_states_from_learner_traces(self, learner_traces):
+        """
+        Forward-backward smoothing of the knowledge states of a learner with the exact engine (see get_exact_engine).
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :return: list of len(learner_traces)+1 dicts {f"{kc.id}": mastering probability}, the i-th one being the
+        mastering probabilities at time slice i given all the learner traces
+        """
+        engine = self.get_exact_engine()
+        _, smoothed = engine.smooth(learner_traces)
+        return [{f"{kc.id}": pbas[i] for i, kc in enumerate(engine.pool_knowledge_components)} for pbas in smoothed]
+
+    def filter_learner_knowledge_states_from_learner_traces(self, learner_traces):
+        """
+        Forward filtering of the knowledge states of a learner, carrying the belief state one trace at a time.
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :return: list of len(learner_traces)+1 dicts {f"{kc.id}": mastering probability}, the i-th one being equal to
+        predict_learner_knowledge_states_from_learner_traces(learner_traces[:i])
+        """
+        engine = self.get_exact_engine()
+        return [engine.to_knowledge_states(belief) for belief in engine.iter_filter(learner_traces)]
+
+    def predict_learner_answers_from_learner_traces(self, learner_traces, prefix_cache=None, min_run_length=None):
+        """
+        Predict in a single pass the probability of each answer of a learner given the previous ones.
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :param prefix_cache: PrefixTrieCache object (e.g. kgraph.learner_layer.prefix_trie_cache.prefix_trie_cache), in
+        which the belief states of the prefixes of learner_traces are looked up before being computed
+        :param min_run_length: int, the length from which the runs of identical answers are carried by the matrix of
+        their update, with the same results up to rounding errors (see JointStateEngine.iter_filter_runs) -- None to
+        update the belief state one answer at a time
+        :return: list of floats, the probability to answer correctly each trace
+        """
+        assert prefix_cache is None or min_run_length is None, "The prefix cache does not handle the run matrices."
+        engine = self.get_bkt_engine()
+        # the answers on KCs without prerequisite link only depend on the previous answers on their KC
+        if engine.covers(trace.get_kc() for trace in learner_traces):
+            prefix_cache, min_run_length = None, None
+        else:
+            engine = self.get_exact_engine()
+        # the parameters are pinned for the whole inference
+        pool = self.associated_learner_pool.get_parameters()
+        if prefix_cache is not None:
+            beliefs = prefix_cache.get_belief_states(engine, learner_traces)
+        elif min_run_length is not None:
+            beliefs = engine.iter_filter_runs(learner_traces, min_run_length)
+        else:
+            # the belief states are streamed, only the mastering probability of the evaluated KC being kept
+            beliefs = engine.iter_filter(learner_traces)
+        correct_predictions = []
+        # the traces come first, so that the belief state after the last trace is not computed
+        for trace, belief in zip(learner_traces, beliefs):
+            slip, guess = pool.get_slip(trace.get_exercise()), pool.get_guess(trace.get_exercise())
+            m_pba = engine.get_marginal(belief, trace.get_kc())
+            correct_predictions.append(m_pba * (1 - slip) + (1 - m_pba) * guess)
+        return correct_predictions
+
+    def score_next_exercises_from_learner_traces(self, learner_traces, exercises=None):
+        """
+        Score every candidate exercise for the next answer of a learner (see JointStateEngine.score_exercises).
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :param exercises: list of Exercise objects, the candidates -- defaults to all the exercises of the domain
+        :return: dict of the success probabilities, information gains, expected mastery changes and mastering
+        probabilities after each answer of the candidates
+        """
+        engine = self.get_exact_engine()
+        return engine.score_exercises(engine.predict(learner_traces), exercises)
+
+    def predict_learner_pool_knowledge_states(self, learner_traces, batch_size=1024):
+        """
+        Batched forward filtering of the knowledge states of many learners at once with the exact engine (see
+        get_exact_engine).
+        :param learner_traces: dict {learner: list of LearnerTrace objects} or list of lists of LearnerTrace objects
+        :param batch_size: int, the number of learners whose belief states are held in memory at once
+        :return: np.array of shape (n_learners, n_steps+1, n_kcs), the mastering probabilities of every KC (in the order
+        of the learner pool) of every learner after each of its traces -- nan after its last trace
+        """
+        engine = self.get_exact_engine()
+        return engine.batch_filter(*engine.pack_learner_traces(learner_traces), batch_size=batch_size)
+
+    def predict_learner_pool_answers(self, learner_traces, batch_size=1024):
+        """
+        Batched prediction of the probability of each answer of many learners given their previous answers.
+        :param learner_traces: dict {learner: list of LearnerTrace objects} or list of lists of LearnerTrace objects
+        :param batch_size: int, the number of learners whose belief states are held in memory at once
+        :return: np.array of shape (n_learners, n_steps), the probability to answer correctly each trace -- nan after
+        the last trace of a learner
+        """
+        return self.predict_learner_pool_knowledge_state_frame(learner_traces, batch_size).success_probabilities
+
+    def predict_learner_pool_knowledge_state_frame(self, learner_traces, batch_size=1024):
+        """
+        Batched forward filtering of the knowledge states of many learners, with the prediction of each of their
+        answers given the previous ones, in one pass.
+        :param learner_traces: dict {learner: list of LearnerTrace objects} or list of lists of LearnerTrace objects
+        :param batch_size: int, the number of learners whose belief states are held in memory at once
+        :return: KnowledgeStateFrame object, indexed by the ids of the learners if learner_traces is a dict
+        """
+        engine = self.get_exact_engine()
+        kc_axes, success_likelihoods, successes, mask = engine.pack_learner_traces(learner_traces)
+        mastering_pbas = engine.batch_filter(kc_axes, success_likelihoods, successes, mask, batch_size=batch_size)
+        # mastering probability of the evaluated KC before each trace
+        pool_positions = np.argsort(engine.pool_kc_axes)[kc_axes]
+        m_pbas = np.take_along_axis(mastering_pbas[:, :-1], pool_positions[..., np.newaxis], axis=2)[..., 0]
+        correct_predictions = m_pbas * success_likelihoods[..., 1] + (1 - m_pbas) * success_likelihoods[..., 0]
+        learner_ids = [learner.id for learner in learner_traces] if isinstance(learner_traces, dict) else None
+        return KnowledgeStateFrame(mastering_pbas, engine.pool_knowledge_components, learner_ids,
+                                   np.where(mask, correct_predictions, np.nan), mask)
+
+
+class NoisyANDInferenceModel(InferenceModel):
+    gate_type = 'AND'
+
+    def __init__(self, learner_pool, params, backend=None, gate_decomposition=None, evidence_mode='hard'):
+        super().__init__(learner_pool, backend, gate_decomposition, evidence_mode)
         self.params = params if params else self._set_default_params()
         self.setup_dbn()
 
@@ -59,102 +947,106 @@ class NoisyANDInferenceModel:
         return self.params['c'][source][target]
 
     def set_c_param(self, source, target, value):
-        self.params['c'][source][target] = value
+        # the params are copied on write along the changed path, so that the readers of the former ones are not altered
+        self.refresh_parameters({**self.params, 'c': {**self.params['c'], source: {**self.params['c'][source],
+                                                                                   target: value}}})
 
     def get_s_param(self, source, target):
         return self.params['s'][source][target]
 
     def set_s_param(self, source, target, value):
-        self.params['s'][source][target] = value
+        self.refresh_parameters({**self.params, 's': {**self.params['s'], source: {**self.params['s'][source],
+                                                                                   target: value}}})
 
-    def setup_dbn(self):
-        knowledge_components = self.associated_learner_pool.get_knowledge_components()
+    def get_link_parameters(self):
+        return {(source, target): (self.get_c_param(source, target), self.get_s_param(source, target))
+                for source in self.params['c'] for target in self.params['c'][source]}
+
+    def fill_link_cpts(self, bn, links):
+        names = bn.names()
+        for parent, kc in links:
+            c, s = self.get_c_param(parent, kc), self.get_s_param(parent, kc)
+            for time in ('0', 't'):
+                if f"(Z[{parent.id}->{kc.id}]){time}" in names:
+                    bn.cpt(f"(Z[{parent.id}->{kc.id}]){time}").fillWith([1 - s, s, 1 - c, c])
+
+    def _set_link_parameters(self, params):
+        self.params = params
+
+    def get_gate_links(self, kc):
+        return [(parent, self.get_c_param(parent, kc), self.get_s_param(parent, kc))
+                for parent in self.associated_learner_pool.get_kc_parents(kc)]
+
+    def get_initial_gate_input(self, kc):
+        if kc in self.get_link_strengths().keys():
+            return 1.
+        return self.associated_learner_pool.get_prior(kc)
+
+    def has_prior_node(self, kc):
+        return kc not in self.get_link_strengths().keys()
+
+    def setup_dbn(self, knowledge_components=None, bn=None):
+        """
+        Introduce the nodes and arcs of the 2TBN of the model in a bayesian network.
+        :param knowledge_components: list of KnowledgeComponent objects, the KCs to be introduced -- must contain the
+        sources of their gates, defaults to all the KCs of the learner pool
+        :param bn: gum.BayesNet object, defaults to the model's 2TBN
+        """
+        bn = self.bn if bn is None else bn
+        all_knowledge_components = self.associated_learner_pool.get_knowledge_components()
+        if knowledge_components is None:
+            knowledge_components = all_knowledge_components
         priors = {kc: self.associated_learner_pool.get_prior(kc) for kc in knowledge_components}
         link_strengths = self.get_link_strengths()
 
         # Introduce the structure of the temporal relationships between same KC's nodes
+        kc_nodes, gate_inputs = {}, {}
         for kc in knowledge_components:
             # Introduce node for KC at time 0
             if kc in link_strengths.keys():
-                self.bn.addAND(gum.LabelizedVariable(f"({kc.id})0", f"({kc.id})0", 2))
+                kc_node_0 = bn.addAND(gum.LabelizedVariable(f"({kc.id})0", f"({kc.id})0", 2))
             else:
-                self.bn.add(gum.LabelizedVariable(f"({kc.id})0", f"({kc.id})0", 2))
-                self.bn.cpt(f"({kc.id})0").fillWith([1 - priors[kc], priors[kc]])
+                kc_node_0 = bn.add(gum.LabelizedVariable(f"({kc.id})0", f"({kc.id})0", 2))
+                bn.cpt(kc_node_0).fillWith([1 - priors[kc], priors[kc]])
 
-            self.bn.add(gum.LabelizedVariable(f"(Z[({kc.id})0->({kc.id})t])t", f"(Z[({kc.id})0->({kc.id})t])t", 2))
-            self.bn.addArc(f"({kc.id})0", f"(Z[({kc.id})0->({kc.id})t])t")
+            z_node = bn.add(gum.LabelizedVariable(f"(Z[({kc.id})0->({kc.id})t])t", f"(Z[({kc.id})0->({kc.id})t])t", 2))
+            bn.addArc(kc_node_0, z_node)
 
-            self.bn.addAND(gum.LabelizedVariable(f"({kc.id})t", f"({kc.id})t", 2))
-            self.bn.addArc(f"(Z[({kc.id})0->({kc.id})t])t", f"({kc.id})t")
+            kc_node_t = bn.addAND(gum.LabelizedVariable(f"({kc.id})t", f"({kc.id})t", 2))
 
-            self.bn.cpt(f"(Z[({kc.id})0->({kc.id})t])t")[{f"({kc.id})0": 0}] = [1, 0]
-            self.bn.cpt(f"(Z[({kc.id})0->({kc.id})t])t")[{f"({kc.id})0": 1}] = [0, 1]
+            # the first variable of a CPT varies the fastest, then its parents
+            bn.cpt(z_node).fillWith([1, 0, 0, 1])
+            kc_nodes[kc] = (kc_node_0, kc_node_t)
+            gate_inputs[kc] = ([], [z_node])
 
         for kc in knowledge_components:
             parents = self.associated_learner_pool.get_kc_parents(kc)
             if parents:
                 for parent in parents:
-                    self.bn.add(
+                    z_node_0 = bn.add(
                         gum.LabelizedVariable(f"(Z[{parent.id}->{kc.id}])0", f"(Z[{parent.id}->{kc.id}])0", 2))
-                    self.bn.add(
+                    z_node_t = bn.add(
                         gum.LabelizedVariable(f"(Z[{parent.id}->{kc.id}])t", f"(Z[{parent.id}->{kc.id}])t", 2))
                     c, s = self.get_c_param(parent, kc), self.get_s_param(parent, kc)
-                    self.bn.addArc(f"({parent.id})0", f"(Z[{parent.id}->{kc.id}])0")
-                    self.bn.addArc(f"({parent.id})t", f"(Z[{parent.id}->{kc.id}])t")
+                    bn.addArc(kc_nodes[parent][0], z_node_0)
+                    bn.addArc(kc_nodes[parent][1], z_node_t)
 
-                    self.bn.cpt(f"(Z[{parent.id}->{kc.id}])0")[{f"({parent.id})0": 0}] = [1 - s, s]
-                    self.bn.cpt(f"(Z[{parent.id}->{kc.id}])0")[{f"({parent.id})0": 1}] = [1 - c, c]
+                    bn.cpt(z_node_0).fillWith([1 - s, s, 1 - c, c])
+                    bn.cpt(z_node_t).fillWith([1 - s, s, 1 - c, c])
 
-                    self.bn.cpt(f"(Z[{parent.id}->{kc.id}])t")[{f"({parent.id})t": 0}] = [1 - s, s]
-                    self.bn.cpt(f"(Z[{parent.id}->{kc.id}])t")[{f"({parent.id})t": 1}] = [1 - c, c]
+                    gate_inputs[kc][0].append(z_node_0)
+                    gate_inputs[kc][1].append(z_node_t)
 
-                    self.bn.addArc(f"(Z[{parent.id}->{kc.id}])t", f"({kc.id})t")
-                    self.bn.addArc(f"(Z[{parent.id}->{kc.id}])0", f"({kc.id})0")
-
-    def predict_learner_knowledge_states_from_learner_traces(self, learner_traces):
-        knowledge_components = self.associated_learner_pool.get_knowledge_components()
-        bn = unroll_2tbn(self.bn, len(learner_traces)+1)
-        # Setup the soft evidences in the BNow
-        evidences = {}
-        for i, trace in enumerate(learner_traces):
-            evaluated_kc = trace.get_kc()
-            success = trace.get_success()
-            exercise = trace.get_exercise()
-            guess, slip = self.associated_learner_pool.get_guess(exercise), self.associated_learner_pool.get_slip(exercise)
-            learn, forget = self.associated_learner_pool.get_learn(evaluated_kc), self.associated_learner_pool.get_forget(evaluated_kc)
-
-            bn.add(gum.LabelizedVariable(f"exercise({exercise.id}){i}", f"exercise({exercise.id}){i}", 2))
-            bn.addArc(f"({evaluated_kc.id}){i}", f"exercise({exercise.id}){i}")
-
-            bn.cpt(f"exercise({exercise.id}){i}")[{f"({evaluated_kc.id}){i}": 0}] = [1 - guess, guess]
-            bn.cpt(f"exercise({exercise.id}){i}")[{f"({evaluated_kc.id}){i}": 1}] = [slip, 1 - slip]
-            evidences[f"exercise({exercise.id}){i}"] = int(success)
-
-            bn.cpt(f"(Z[({evaluated_kc.id})0->({evaluated_kc.id})t]){i+1}")[{f"({evaluated_kc.id}){i}": 0}] = [
-                1 - learn, learn
-            ]
-            bn.cpt(f"(Z[({evaluated_kc.id})0->({evaluated_kc.id})t]){i+1}")[{f"({evaluated_kc.id}){i}": 1}] = [
-                forget, 1 - forget
-            ]
-            """
-            evidences[f"({evaluated_kc.id}){i}"] = [guess, 1 - guess] if success else [
-                1 - slip, slip]
-        """
-        # Setup the inference
-        ie = gum.LazyPropagation(bn)
-        ie.setEvidence(evidences)
-        ie.makeInference()
-        knowledge_states = {}
         for kc in knowledge_components:
-            knowledge_states[f"{kc.id}"] = ie.posterior(bn.idFromName(f"({kc.id}){len(evidences.keys())}"))[1]
-        return knowledge_states
+            self.add_gate_inputs(bn, kc_nodes[kc][1], gate_inputs[kc][1])
+            self.add_gate_inputs(bn, kc_nodes[kc][0], gate_inputs[kc][0])
 
 
-class NoisyORInferenceModel:
+class NoisyORInferenceModel(InferenceModel):
+    gate_type = 'OR'
 
-    def __init__(self, learner_pool, c_params):
-        self.associated_learner_pool = learner_pool
-        self.bn = gum.BayesNet()
+    def __init__(self, learner_pool, c_params, backend=None, gate_decomposition=None, evidence_mode='hard'):
+        super().__init__(learner_pool, backend, gate_decomposition, evidence_mode)
         self.c_params = c_params if c_params else self._set_default_c_params()
         self.setup_dbn()
 
@@ -176,88 +1068,91 @@ class NoisyORInferenceModel:
         return self.c_params[source][target]
 
     def set_c_param(self, source, target, value):
-        self.c_params[source][target] = value
+        # the c_params are copied on write along the changed path, so that the readers of the former ones are not
+        # altered
+        self.refresh_parameters({**self.c_params, source: {**self.c_params[source], target: value}})
 
-    def setup_dbn(self):
-        knowledge_components = self.associated_learner_pool.get_knowledge_components()
+    def get_link_parameters(self):
+        return {(source, target): (self.get_c_param(source, target),)
+                for source in self.c_params for target in self.c_params[source]}
+
+    def fill_link_cpts(self, bn, links):
+        names = bn.names()
+        for kc, child in links:
+            c = self.get_c_param(kc, child)
+            for time in ('0', 't'):
+                if f"(Z[{child.id}->{kc.id}]){time}" in names:
+                    bn.cpt(f"(Z[{child.id}->{kc.id}]){time}").fillWith([1, 0, 1 - c, c])
+
+    def _set_link_parameters(self, c_params):
+        self.c_params = c_params
+
+    def get_gate_links(self, kc):
+        return [(child, self.get_c_param(kc, child), 0.)
+                for child in self.associated_learner_pool.get_learner_pool_kc_children(kc)]
+
+    def get_initial_gate_input(self, kc):
+        if kc in get_leaf_nodes(self.associated_learner_pool.get_knowledge_components(), self.get_link_strengths()):
+            return self.associated_learner_pool.get_prior(kc)
+        return 0.
+
+    def has_prior_node(self, kc):
+        return all(kc not in parents for parents in self.get_link_strengths().values())
+
+    def setup_dbn(self, knowledge_components=None, bn=None):
+        """
+        Introduce the nodes and arcs of the 2TBN of the model in a bayesian network.
+        :param knowledge_components: list of KnowledgeComponent objects, the KCs to be introduced -- must contain the
+        sources of their gates, defaults to all the KCs of the learner pool
+        :param bn: gum.BayesNet object, defaults to the model's 2TBN
+        """
+        bn = self.bn if bn is None else bn
+        all_knowledge_components = self.associated_learner_pool.get_knowledge_components()
+        if knowledge_components is None:
+            knowledge_components = all_knowledge_components
         priors = {kc: self.associated_learner_pool.get_prior(kc) for kc in knowledge_components}
         link_strengths = self.get_link_strengths()
 
         # Introduce the structure of the temporal relationships between same KC's nodes
-        leaf_nodes = get_leaf_nodes(knowledge_components, link_strengths)
+        leaf_nodes = get_leaf_nodes(all_knowledge_components, link_strengths)
+        kc_nodes, gate_inputs = {}, {}
         for kc in knowledge_components:
             # Introduce node for KC at time 0
             if kc in leaf_nodes:
-                self.bn.add(gum.LabelizedVariable(f"({kc.id})0", f"({kc.id})0", 2))
-                self.bn.cpt(f"({kc.id})0").fillWith([1 - priors[kc], priors[kc]])
+                kc_node_0 = bn.add(gum.LabelizedVariable(f"({kc.id})0", f"({kc.id})0", 2))
+                bn.cpt(kc_node_0).fillWith([1 - priors[kc], priors[kc]])
             else:
-                self.bn.addOR(gum.LabelizedVariable(f"({kc.id})0", f"({kc.id})0", 2))
+                kc_node_0 = bn.addOR(gum.LabelizedVariable(f"({kc.id})0", f"({kc.id})0", 2))
 
-            self.bn.add(gum.LabelizedVariable(f"(Z[({kc.id})0->({kc.id})t])t", f"(Z[({kc.id})0->({kc.id})t])t", 2))
-            self.bn.addArc(f"({kc.id})0", f"(Z[({kc.id})0->({kc.id})t])t")
+            z_node = bn.add(gum.LabelizedVariable(f"(Z[({kc.id})0->({kc.id})t])t", f"(Z[({kc.id})0->({kc.id})t])t", 2))
+            bn.addArc(kc_node_0, z_node)
 
-            self.bn.addOR(gum.LabelizedVariable(f"({kc.id})t", f"({kc.id})t", 2))
-            self.bn.addArc(f"(Z[({kc.id})0->({kc.id})t])t", f"({kc.id})t")
+            kc_node_t = bn.addOR(gum.LabelizedVariable(f"({kc.id})t", f"({kc.id})t", 2))
 
-            self.bn.cpt(f"(Z[({kc.id})0->({kc.id})t])t")[{f"({kc.id})0": 0}] = [1, 0]
-            self.bn.cpt(f"(Z[({kc.id})0->({kc.id})t])t")[{f"({kc.id})0": 1}] = [0, 1]
+            # the first variable of a CPT varies the fastest, then its parents
+            bn.cpt(z_node).fillWith([1, 0, 0, 1])
+            kc_nodes[kc] = (kc_node_0, kc_node_t)
+            gate_inputs[kc] = ([], [z_node])
 
         for kc in knowledge_components:
             children = self.associated_learner_pool.get_learner_pool_kc_children(kc)
             if children:
                 for child in children:
-                    self.bn.add(
+                    z_node_0 = bn.add(
                         gum.LabelizedVariable(f"(Z[{child.id}->{kc.id}])0", f"(Z[{child.id}->{kc.id}])0", 2))
-                    self.bn.add(
+                    z_node_t = bn.add(
                         gum.LabelizedVariable(f"(Z[{child.id}->{kc.id}])t", f"(Z[{child.id}->{kc.id}])t", 2))
 
                     c = self.get_c_param(kc, child)
-                    self.bn.addArc(f"({child.id})0", f"(Z[{child.id}->{kc.id}])0")
-                    self.bn.addArc(f"({child.id})t", f"(Z[{child.id}->{kc.id}])t")
-
-                    self.bn.cpt(f"(Z[{child.id}->{kc.id}])0")[{f"({child.id})0": 0}] = [1, 0]
-                    self.bn.cpt(f"(Z[{child.id}->{kc.id}])0")[{f"({child.id})0": 1}] = [1 - c, c]
+                    bn.addArc(kc_nodes[child][0], z_node_0)
+                    bn.addArc(kc_nodes[child][1], z_node_t)
 
-                    self.bn.cpt(f"(Z[{child.id}->{kc.id}])t")[{f"({child.id})t": 0}] = [1, 0]
-                    self.bn.cpt(f"(Z[{child.id}->{kc.id}])t")[{f"({child.id})t": 1}] = [1 - c, c]
+                    bn.cpt(z_node_0).fillWith([1, 0, 1 - c, c])
+                    bn.cpt(z_node_t).fillWith([1, 0, 1 - c, c])
 
-                    self.bn.addArc(f"(Z[{child.id}->{kc.id}])t", f"({kc.id})t")
-                    self.bn.addArc(f"(Z[{child.id}->{kc.id}])0", f"({kc.id})0")
+                    gate_inputs[kc][0].append(z_node_0)
+                    gate_inputs[kc][1].append(z_node_t)
 
-    def predict_learner_knowledge_states_from_learner_traces(self, learner_traces):
-        knowledge_components = self.associated_learner_pool.get_knowledge_components()
-        bn = unroll_2tbn(self.bn, len(learner_traces)+1)
-        # Setup the soft evidences in the BNow
-        evidences = {}
-        for i, trace in enumerate(learner_traces):
-            evaluated_kc = trace.get_kc()
-            success = trace.get_success()
-            exercise = trace.get_exercise()
-            guess, slip = self.associated_learner_pool.get_guess(exercise), self.associated_learner_pool.get_slip(exercise)
-            learn, forget = self.associated_learner_pool.get_learn(evaluated_kc), self.associated_learner_pool.get_forget(evaluated_kc)
-
-            bn.add(gum.LabelizedVariable(f"exercise({exercise.id}){i}", f"exercise({exercise.id}){i}", 2))
-            bn.addArc(f"({evaluated_kc.id}){i}", f"exercise({exercise.id}){i}")
-
-            bn.cpt(f"exercise({exercise.id}){i}")[{f"({evaluated_kc.id}){i}": 0}] = [1 - guess, guess]
-            bn.cpt(f"exercise({exercise.id}){i}")[{f"({evaluated_kc.id}){i}": 1}] = [slip, 1 - slip]
-            evidences[f"exercise({exercise.id}){i}"] = int(success)
-
-            bn.cpt(f"(Z[({evaluated_kc.id})0->({evaluated_kc.id})t]){i+1}")[{f"({evaluated_kc.id}){i}": 0}] = [
-                1 - learn, learn
-            ]
-            bn.cpt(f"(Z[({evaluated_kc.id})0->({evaluated_kc.id})t]){i+1}")[{f"({evaluated_kc.id}){i}": 1}] = [
-                forget, 1 - forget
-            ]
-            """
-            evidences[f"({evaluated_kc.id}){i}"] = [guess, 1 - guess] if success else [
-                1 - slip, slip]
-        """
-        # Setup the inference
-        ie = gum.LazyPropagation(bn)
-        ie.setEvidence(evidences)
-        ie.makeInference()
-        knowledge_states = {}
         for kc in knowledge_components:
-            knowledge_states[f"{kc.id}"] = ie.posterior(bn.idFromName(f"({kc.id}){len(evidences.keys())}"))[1]
-        return knowledge_states
\ No newline at end of file
+            self.add_gate_inputs(bn, kc_nodes[kc][1], gate_inputs[kc][1])
+            self.add_gate_inputs(bn, kc_nodes[kc][0], gate_inputs[kc][0])
@@ -0,0 +1,128 @@
+import asyncio
+
+
+class InferenceServer(object):
+
+    def __init__(self, learner_pool, max_batch_size=256, max_latency=.002, executor=None):
+        """
+        Asyncio front end that updates the knowledge states of the learners of a LearnerPool as their answers come.
+        The requests are queued and gathered into micro-batches: a batch is processed as soon as it holds
+        max_batch_size requests or max_latency seconds after its first request, with one vectorized step of the
+        exact engine for all its learners. The batches are run in an executor, so that the event loop keeps on
+        queuing requests meanwhile.
+        :param learner_pool: LearnerPool object, whose inference model has been set (see set_inference_model)
+        :param max_batch_size: int, the maximal number of requests of a batch
+        :param max_latency: float, the maximal time (in seconds) a request waits for its batch to be filled
+        :param executor: concurrent.futures.Executor object, defaults to the one of the event loop
+        """
+        assert max_batch_size > 0, "max_batch_size must be positive."
+        assert max_latency >= 0, "max_latency must be non negative."
+        self.learner_pool = learner_pool
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.executor = executor
+        self.queue = None
+        self.serving_task = None
+        self.n_requests, self.n_batches = 0, 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.stop()
+
+    async def start(self):
+        """
+        Start processing the requests in the running event loop.
+        """
+        assert self.serving_task is None, "The server is already started."
+        self.queue = asyncio.Queue()
+        self.serving_task = asyncio.get_running_loop().create_task(self._serve())
+
+    async def stop(self):
+        """
+        Process the queued requests, then stop the server.
+        """
+        await self.queue.join()
+        self.serving_task.cancel()
+        try:
+            await self.serving_task
+        except asyncio.CancelledError:
+            pass
+        self.serving_task = None
+
+    async def observe(self, learner, learner_trace):
+        """
+        Update the knowledge state of a learner with its last answer, as Learner.observe does.
+        :param learner: Learner object of the LearnerPool
+        :param learner_trace: LearnerTrace object, the last answer of the learner
+        :return: dict {kc: mastering probability}, the mastering probabilities of the learner after the trace
+        """
+        assert self.serving_task is not None, "The server must be started."
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((learner, learner_trace, future))
+        return await future
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            try:
+                results = await loop.run_in_executor(self.executor, self._process_batch, batch)
+            except Exception as exception:
+                results = [exception] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            self.n_requests += len(batch)
+            self.n_batches += 1
+            for _ in batch:
+                self.queue.task_done()
+
+    def _process_batch(self, batch):
+        """
+        Update the belief states of the learners of a batch. The requests of a same learner are applied in their order
+        of arrival, in successive vectorized steps.
+        :return: list of the mastering probabilities after each request, in the order of the batch
+        """
+        engine = self.learner_pool.get_inference_model().get_filtering_engine()
+        assert hasattr(engine, 'update_batch'), "The inference model must filter with an exact engine."
+        knowledge_components = self.learner_pool.get_knowledge_components()
+        results = [None] * len(batch)
+        pending = list(range(len(batch)))
+        while pending:
+            step, deferred, seen_learners = [], [], set()
+            for i in pending:
+                if batch[i][0] in seen_learners:
+                    deferred.append(i)
+                else:
+                    seen_learners.add(batch[i][0])
+                    step.append(i)
+            beliefs = engine.update_batch([batch[i][0].get_belief_state() for i in step],
+                                          [batch[i][1] for i in step])
+            for i, belief in zip(step, beliefs):
+                learner = batch[i][0]
+                learner.belief_state = belief
+                learner_marginals = engine.get_marginals(belief)
+                learner.mastering_probabilities = {kc: learner_marginals[engine.kc_axes[kc]]
+                                                   for kc in knowledge_components}
+                results[i] = learner.mastering_probabilities
+            pending = deferred
+        return results
@@ -0,0 +1,471 @@
+import numpy as np
+import threading
+from collections import OrderedDict
+from kgraph.learner_layer.belief_state_engine import SmoothingEngine
+
+
+def get_topological_order(knowledge_components, gate_sources):
+    """
+    Order the knowledge components so that every gate source comes before the KC it enters.
+    :param knowledge_components: list of KnowledgeComponent objects
+    :param gate_sources: dict {kc: [source kcs of kc's gate]}
+    :return: list of KnowledgeComponent objects, in topological order
+    """
+    in_degrees = {kc: len(gate_sources[kc]) for kc in knowledge_components}
+    targets = {kc: [] for kc in knowledge_components}
+    for kc in knowledge_components:
+        for source in gate_sources[kc]:
+            targets[source].append(kc)
+    order = []
+    ready = [kc for kc in knowledge_components if in_degrees[kc] == 0]
+    while ready:
+        kc = ready.pop(0)
+        order.append(kc)
+        for target in targets[kc]:
+            in_degrees[target] -= 1
+            if in_degrees[target] == 0:
+                ready.append(target)
+    assert len(order) == len(knowledge_components), "The prerequisite links must not contain any cycle."
+    return order
+
+
+def get_connected_components(knowledge_components, gate_sources):
+    """
+    Return the connected components of the prerequisite graph.
+    :param knowledge_components: list of KnowledgeComponent objects
+    :param gate_sources: dict {kc: [source kcs of kc's gate]}
+    :return: dict {kc: frozenset of the KCs of its connected component}
+    """
+    neighbours = {kc: set() for kc in knowledge_components}
+    for kc in knowledge_components:
+        for source in gate_sources[kc]:
+            neighbours[kc].add(source)
+            neighbours[source].add(kc)
+    components = {}
+    for kc in knowledge_components:
+        if kc in components:
+            continue
+        component, to_visit = set(), [kc]
+        while to_visit:
+            visited_kc = to_visit.pop()
+            if visited_kc not in component:
+                component.add(visited_kc)
+                to_visit.extend(neighbours[visited_kc])
+        component = frozenset(component)
+        for visited_kc in component:
+            components[visited_kc] = component
+    return components
+
+
+def get_binary_entropy(pbas):
+    """
+    Return the entropy (in bits) of Bernoulli distributions.
+    :param pbas: np.array, the probabilities of success
+    """
+    pbas = np.clip(pbas, 1e-12, 1 - 1e-12)
+    return - pbas * np.log2(pbas) - (1 - pbas) * np.log2(1 - pbas)
+
+
+class JointStateEngine(SmoothingEngine):
+    # the maximal number of KCs of the engines whose runs of identical answers are carried by the matrix of their
+    # update (see get_run_matrix), of 4**n_kcs floats
+    max_run_matrix_kcs = 8
+    # the maximal number of run matrices kept by an engine
+    max_run_matrices = 32
+
+    def __init__(self, inference_model, knowledge_components=None):
+        """
+        Compiled version of the NoisyAND/NoisyOR dynamic bayesian network of an inference model, on which inference
+        is done exactly over the joint knowledge state of the learner (one axis of size 2 per KC) with NumPy array
+        operations only. The priors, link parameters, learns, forgets, guesses and slips of the learner pool are
+        compiled into transition and emission tensors, so that they are the ones of the pool at compile time (the
+        inference model recompiles its engine when they change, see get_joint_state_engine).
+        A belief state is carried forward one answer at a time, so that a sequence of n answers is processed in n steps
+        instead of unrolling n networks.
+        The engine may be restricted to a union of connected components of the prerequisite graph, whose KCs evolve
+        independently of the others: the traces on the other KCs then only move its belief state to the next time
+        slice, applying the gates of its KCs.
+        :param inference_model: NoisyANDInferenceModel or NoisyORInferenceModel, the model to be compiled
+        :param knowledge_components: list of KnowledgeComponent objects, a union of connected components of the
+        prerequisite graph -- defaults to all the KCs of the learner pool
+        """
+        self.inference_model = inference_model
+        self.learner_pool = inference_model.associated_learner_pool
+        # taken before reading the parameters, so that an engine compiled during a change of the parameters is stale
+        self.parameters_version = inference_model.get_parameters_version()
+        parameters = self.learner_pool.get_parameters()
+        if knowledge_components is None:
+            knowledge_components = self.learner_pool.get_knowledge_components()
+        else:
+            # in the order of the learner pool
+            knowledge_components = set(knowledge_components)
+            knowledge_components = [kc for kc in self.learner_pool.get_knowledge_components()
+                                    if kc in knowledge_components]
+        gate_links = {kc: inference_model.get_gate_links(kc) for kc in knowledge_components}
+        assert all(link[0] in gate_links for kc in knowledge_components for link in gate_links[kc]), \
+            "The KCs must be a union of connected components of the prerequisite graph."
+        self.knowledge_components = get_topological_order(
+            knowledge_components, {kc: [link[0] for link in gate_links[kc]] for kc in knowledge_components})
+        self.kc_axes = {kc: axis for axis, kc in enumerate(self.knowledge_components)}
+        self.n_kcs = len(self.knowledge_components)
+        # axes of the KCs in the order of the learner pool, used to format the results
+        self.pool_kc_axes = np.array([self.kc_axes[kc] for kc in knowledge_components], dtype=int)
+        self.pool_knowledge_components = list(knowledge_components)
+
+        self.initial_gate_inputs = np.array([inference_model.get_initial_gate_input(kc)
+                                             for kc in self.knowledge_components])
+        # For each KC, the factor P((kc)t | Z[(kc)0->(kc)t], sources of kc's gate) and the einsum sublists to apply it
+        # forward (from Z nodes to KC nodes) and backward (from KC nodes to Z nodes)
+        self.gate_factors, self.gate_sublists, self.backward_gate_sublists = [], [], []
+        for axis, kc in enumerate(self.knowledge_components):
+            source_axes = [self.kc_axes[link[0]] for link in gate_links[kc]]
+            self.gate_factors.append(self._compute_gate_factor(inference_model.gate_type, gate_links[kc]))
+            output_axes = [self.n_kcs if i == axis else i for i in range(self.n_kcs)]
+            self.gate_sublists.append(([Ellipsis, *range(self.n_kcs)],
+                                       [axis, *source_axes, self.n_kcs],
+                                       [Ellipsis, *output_axes]))
+            self.backward_gate_sublists.append(([Ellipsis, *output_axes],
+                                                [axis, *source_axes, self.n_kcs],
+                                                [Ellipsis, *range(self.n_kcs)]))
+
+        # Transition tensor of every KC: P(Z[(kc)0->(kc)t]=j | (kc)t-1=i) when kc is the evaluated KC
+        self.learn_forget_matrices = np.array([
+            [[1 - parameters.get_learn(kc), parameters.get_learn(kc)],
+             [parameters.get_forget(kc), 1 - parameters.get_forget(kc)]]
+            for kc in self.knowledge_components])
+        # Emission tensor of every exercise: P(success=i | (kc)t=j)
+        self.answer_likelihoods = {}
+        for kc in self.knowledge_components:
+            for exercise in kc.get_exercises():
+                guess, slip = parameters.get_guess(exercise), parameters.get_slip(exercise)
+                self.answer_likelihoods[exercise] = np.array([[1 - guess, slip], [guess, 1 - slip]])
+        self.run_matrices = OrderedDict()
+        self.run_matrices_lock = threading.Lock()
+
+    def get_compiled_arrays(self):
+        return [self.initial_gate_inputs, *self.gate_factors, self.learn_forget_matrices]
+
+    @staticmethod
+    def _compute_gate_factor(gate_type, links):
+        """
+        Compute the conditional probability table of a KC node given the Z node of its own previous state and the
+        sources of its noisy gate, marginalizing the Z nodes of the prerequisite links.
+        :param gate_type: str, 'AND' or 'OR'
+        :param links: list of (source, P(Z=1|source mastered), P(Z=1|source not mastered)) tuples
+        :return: np.array of shape (2,)*(len(links)+2), axes being (self input, sources..., KC)
+        """
+        n_links = len(links)
+        self_input = np.array([0., 1.]).reshape((2,) + (1,) * n_links)
+        z_pbas = []
+        for i, (_, p_mastered, p_not_mastered) in enumerate(links):
+            shape = [1] * (n_links + 1)
+            shape[i + 1] = 2
+            z_pbas.append(np.array([p_not_mastered, p_mastered]).reshape(shape))
+        if gate_type == 'AND':
+            p_on = self_input
+            for z_pba in z_pbas:
+                p_on = p_on * z_pba
+        else:
+            p_off = 1 - self_input
+            for z_pba in z_pbas:
+                p_off = p_off * (1 - z_pba)
+            p_on = 1 - p_off
+        p_on = np.broadcast_to(p_on, (2,) * (n_links + 1))
+        return np.stack((1 - p_on, p_on), axis=-1)
+
+    def _apply_gates(self, gate_inputs):
+        """
+        Compute the joint distribution of the KC nodes of a time slice from the joint distribution of their
+        Z[(kc)0->(kc)t] nodes, processing the KCs in topological order.
+        :param gate_inputs: np.array of shape (...,) + (2,)*n_kcs
+        :return: np.array of the same shape, the joint distribution over KC nodes
+        """
+        belief = gate_inputs
+        for factor, (belief_sublist, factor_sublist, output_sublist) in zip(self.gate_factors, self.gate_sublists):
+            belief = np.einsum(belief, belief_sublist, factor, factor_sublist, output_sublist)
+        return belief
+
+    def _apply_backward_gates(self, message):
+        """
+        Transpose of _apply_gates: compute P(evidence | Z[(kc)0->(kc)t] nodes) from P(evidence | KC nodes).
+        """
+        for factor, (message_sublist, factor_sublist, output_sublist) in zip(self.gate_factors[::-1],
+                                                                             self.backward_gate_sublists[::-1]):
+            message = np.einsum(message, message_sublist, factor, factor_sublist, output_sublist)
+        return message
+
+    def _apply_to_axis(self, belief, kc, matrix):
+        """
+        Multiply the belief by a 2x2 matrix (or a likelihood vector) along the axis of a KC.
+        """
+        axis = self.kc_axes[kc] - self.n_kcs
+        belief = np.moveaxis(belief, axis, -1)
+        belief = belief @ matrix if matrix.ndim == 2 else belief * matrix
+        return np.moveaxis(belief, -1, axis)
+
+    def _multiply_along_axis(self, beliefs, axis, vectors):
+        """
+        Multiply each belief of a batch by its own vector along the same KC axis.
+        :param beliefs: np.array of shape (n_beliefs,) + (2,)*n_kcs
+        :param axis: int, the axis of the KC in the joint state
+        :param vectors: np.array of shape (n_beliefs, 2)
+        """
+        shape = [len(vectors)] + [1] * self.n_kcs
+        shape[axis + 1] = 2
+        return beliefs * vectors.reshape(shape)
+
+    def get_initial_belief_state(self):
+        """
+        Return the joint distribution of the KC nodes at time 0.
+        :return: np.array of shape (2,)*n_kcs
+        """
+        gate_inputs = np.ones(())
+        for p_on in self.initial_gate_inputs:
+            gate_inputs = np.multiply.outer(gate_inputs, np.array([1 - p_on, p_on]))
+        return self._apply_gates(gate_inputs)
+
+    def observe(self, belief, trace):
+        """
+        Update a belief state with the evidence of a learner trace.
+        :param belief: np.array, the joint distribution over KC nodes before the answer
+        :param trace: LearnerTrace, the answer of the learner
+        :return: np.array, the normalized joint distribution over KC nodes given the answer
+        """
+        if trace.get_kc() not in self.kc_axes:
+            return belief
+        belief = self._apply_to_axis(belief, trace.get_kc(),
+                                     self.get_answer_likelihood(trace.get_exercise(), trace.get_success()))
+        return belief / belief.sum()
+
+    def transition(self, belief, evaluated_kc):
+        """
+        Move a belief state to the next time slice, the evaluated KC being subject to learn and forget.
+        :param belief: np.array, the joint distribution over KC nodes of the current time slice
+        :param evaluated_kc: KnowledgeComponent, the KC evaluated at the current time slice -- None, or a KC the engine
+        does not handle, to apply the gates only
+        :return: np.array, the joint distribution over KC nodes of the next time slice
+        """
+        if evaluated_kc not in self.kc_axes:
+            return self._apply_gates(belief)
+        gate_inputs = self._apply_to_axis(belief, evaluated_kc,
+                                          self.learn_forget_matrices[self.kc_axes[evaluated_kc]])
+        return self._apply_gates(gate_inputs)
+
+    def update(self, belief, trace):
+        """
+        Carry a belief state forward through one learner trace (evidence, then transition).
+        """
+        return self.transition(self.observe(belief, trace), trace.get_kc())
+
+    def get_marginals(self, belief):
+        """
+        Return the mastering probability of every KC from a joint belief state.
+        :return: np.array of shape (..., n_kcs)
+        """
+        n_batch_dims = belief.ndim - self.n_kcs
+        marginals = []
+        for axis in range(self.n_kcs):
+            summed_axes = tuple(n_batch_dims + i for i in range(self.n_kcs) if i != axis)
+            marginals.append(belief.sum(axis=summed_axes)[..., 1])
+        return np.stack(marginals, axis=-1)
+
+    def get_marginal(self, belief, kc):
+        """
+        Return the mastering probability of one KC from a joint belief state.
+        """
+        axis = self.kc_axes[kc]
+        return belief.sum(axis=tuple(i for i in range(self.n_kcs) if i != axis))[1]
+
+    def to_knowledge_states(self, belief):
+        """
+        Format a belief state as predict_learner_knowledge_states_from_learner_traces does.
+        :return: dict {f"{kc.id}": mastering probability}
+        """
+        marginals = self.get_marginals(belief)
+        return {f"{kc.id}": marginals[self.kc_axes[kc]] for kc in self.pool_knowledge_components}
+
+    def score_exercises(self, belief, exercises=None):
+        """
+        Look one answer ahead: score every candidate exercise from a belief state, for adaptive exercise selection.
+        The belief state is transitioned once per evaluated KC and per state of this KC (the evidence of an answer only
+        reweights these two states), so that the outcomes of all the candidates are scored with array operations only.
+        :param belief: np.array of shape (2,)*n_kcs, the belief state of the learner
+        :param exercises: list of Exercise objects, the candidates -- defaults to all the exercises of the domain
+        :return: dict with, for each candidate, in the order of exercises:
+            'success_probabilities', np.array of shape (n_exercises,), the probability to answer correctly,
+            'information_gains', np.array of shape (n_exercises,), the expected information (in bits) the answer gives
+            on the evaluated KC, i.e. the mutual information between the answer and the state of the KC,
+            'expected_mastery_changes', np.array of shape (n_exercises,), the expected change of the sum of the
+            mastering probabilities of the KCs after the answer,
+            'mastering_probabilities', np.array of shape (n_exercises, 2, n_kcs), the mastering probabilities of the
+            KCs (in the order of the learner pool) after a wrong and after a right answer
+        """
+        if exercises is None:
+            exercises = list(self.answer_likelihoods.keys())
+        exercise_axes = np.array([self.kc_axes[exercise.get_kc()] for exercise in exercises], dtype=int)
+        # likelihoods[j, answer, state of the evaluated KC]
+        likelihoods = np.array([self.answer_likelihoods[exercise] for exercise in exercises]).reshape(-1, 2, 2)
+        marginals = self.get_marginals(belief)
+
+        # For each evaluated KC, the mastering probabilities of the next time slice, joint with each of its states
+        axes, exercise_positions = np.unique(exercise_axes, return_inverse=True)
+        restricted_beliefs = []
+        for axis in axes:
+            for state in range(2):
+                restricted_belief = self._multiply_along_axis(belief[np.newaxis], axis, np.eye(2)[[state]])
+                restricted_beliefs.append(self._apply_to_axis(restricted_belief, self.knowledge_components[axis],
+                                                              self.learn_forget_matrices[axis]))
+        joint_marginals = self.get_marginals(self._apply_gates(np.concatenate(restricted_beliefs)))
+        joint_marginals = joint_marginals.reshape(len(axes), 2, self.n_kcs)[exercise_positions]
+
+        m_pbas = marginals[exercise_axes]
+        state_pbas = np.stack((1 - m_pbas, m_pbas), axis=-1)
+        answer_pbas = np.einsum('jas,js->ja', likelihoods, state_pbas)
+        mastering_pbas = np.einsum('jas,jsk->jak', likelihoods, joint_marginals)
+        mastering_pbas = np.divide(mastering_pbas, answer_pbas[..., np.newaxis],
+                                   out=np.zeros(mastering_pbas.shape), where=answer_pbas[..., np.newaxis] > 0)
+        information_gains = get_binary_entropy(answer_pbas[:, 1]) - np.einsum(
+            'js,js->j', state_pbas, get_binary_entropy(likelihoods[:, 1]))
+        return {
+            'success_probabilities': answer_pbas[:, 1],
+            'information_gains': information_gains,
+            'expected_mastery_changes': joint_marginals.sum(axis=(1, 2)) - marginals.sum(),
+            'mastering_probabilities': mastering_pbas[..., self.pool_kc_axes],
+        }
+
+    def get_run_matrix(self, exercise, success):
+        """
+        Return the matrix of the update of a flattened belief state through an answer, before normalization. The update
+        is linear in the belief state, so that the answers of a run of identical answers (same exercise, same outcome)
+        are carried by matrix-vector products, without the einsums of the gates. The max_run_matrices last used ones
+        are kept.
+        :param exercise: Exercise object, the exercise of the answers
+        :param success: bool, the outcome of the answers
+        :return: np.array of shape (2**n_kcs, 2**n_kcs)
+        """
+        key = (exercise, bool(success))
+        with self.run_matrices_lock:
+            if key in self.run_matrices:
+                self.run_matrices.move_to_end(key)
+                return self.run_matrices[key]
+        # the update of every state of the learner, as a batch of belief states
+        size = 2 ** self.n_kcs
+        states = np.eye(size).reshape((size,) + (2,) * self.n_kcs)
+        evaluated_kc = exercise.get_kc()
+        if evaluated_kc in self.kc_axes:
+            states = self._apply_to_axis(states, evaluated_kc, self.get_answer_likelihood(exercise, success))
+        run_matrix = self.transition(states, evaluated_kc).reshape(size, size).T
+        with self.run_matrices_lock:
+            run_matrix = self.run_matrices.setdefault(key, run_matrix)
+            while len(self.run_matrices) > self.max_run_matrices:
+                self.run_matrices.popitem(last=False)
+        return run_matrix
+
+    def iter_filter_runs(self, learner_traces, min_run_length=8):
+        """
+        Forward filtering that carries the long runs of identical answers (same exercise, same outcome), e.g. of
+        drilling exercises, by the matrix of their update (see get_run_matrix): from the min_run_length-th answer of a
+        run on, an update is a single matrix-vector product, several times faster than update for up to
+        max_run_matrix_kcs KCs. Nothing is extrapolated, so that the belief states are the ones of iter_filter up to
+        rounding errors. Beyond max_run_matrix_kcs KCs, the engine filters as iter_filter does.
+        :param learner_traces: iterable of LearnerTrace objects, in chronological order
+        :param min_run_length: int, the length from which a run is carried by its matrix, whose computation updates a
+        batch of 2**n_kcs belief states
+        :return: generator of the len(learner_traces)+1 joint belief states
+        """
+        assert min_run_length >= 1, "min_run_length must be positive."
+        if self.n_kcs > self.max_run_matrix_kcs:
+            yield from self.iter_filter(learner_traces)
+            return
+        belief = self.get_initial_belief_state()
+        yield belief
+        run_key, run_length = None, 0
+        for trace in learner_traces:
+            key = (trace.get_exercise(), trace.get_success())
+            run_key, run_length = key, run_length + 1 if key == run_key else 1
+            if run_length < min_run_length:
+                belief = self.update(belief, trace)
+            else:
+                belief = self.get_run_matrix(*key) @ belief.reshape(-1)
+                belief = (belief / belief.sum()).reshape((2,) * self.n_kcs)
+            yield belief
+
+    def _get_initial_message(self):
+        return np.ones((2,) * self.n_kcs)
+
+    def _backward_step(self, message, trace):
+        """
+        Carry a backward message P(future evidence | KC nodes of the next time slice) to the time slice of a trace.
+        """
+        evaluated_kc = trace.get_kc()
+        message = self._apply_backward_gates(message)
+        if evaluated_kc not in self.kc_axes:
+            return message / message.max()
+        message = self._apply_to_axis(message, evaluated_kc, self.learn_forget_matrices[self.kc_axes[evaluated_kc]].T)
+        message = self._apply_to_axis(message, evaluated_kc,
+                                      self.get_answer_likelihood(trace.get_exercise(), trace.get_success()))
+        return message / message.max()
+
+    def _condition(self, belief, message):
+        posterior = belief * message
+        return posterior / posterior.sum()
+
+    def batch_update(self, beliefs, kc_axes, likelihoods):
+        """
+        Carry several belief states forward through one trace each (evidence, then transition).
+        :param beliefs: np.array of shape (n_beliefs,) + (2,)*n_kcs
+        :param kc_axes: np.array of shape (n_beliefs,), the axis of the evaluated KC of each trace -- -1 for the KCs the
+        engine does not handle
+        :param likelihoods: np.array of shape (n_beliefs, 2), the likelihood of each answer given the state of its KC
+        :return: np.array of shape (n_beliefs,) + (2,)*n_kcs
+        """
+        beliefs = beliefs.copy()
+        for axis in np.unique(kc_axes[kc_axes >= 0]):
+            learners = np.flatnonzero(kc_axes == axis)
+            observed = self._multiply_along_axis(beliefs[learners], axis, likelihoods[learners])
+            observed /= observed.sum(axis=tuple(range(1, self.n_kcs + 1))).reshape((-1,) + (1,) * self.n_kcs)
+            beliefs[learners] = self._apply_to_axis(observed, self.knowledge_components[axis],
+                                                    self.learn_forget_matrices[axis])
+        return self._apply_gates(beliefs)
+
+    def update_batch(self, beliefs, learner_traces):
+        """
+        Carry the belief states of several learners forward through one trace each, as update does for one learner.
+        :param beliefs: list of np.array, the belief states of the learners
+        :param learner_traces: list of LearnerTrace objects, the trace of each learner
+        :return: np.array of shape (n_learners,) + (2,)*n_kcs, the new belief states
+        """
+        kc_axes = np.array([self.kc_axes.get(trace.get_kc(), -1) for trace in learner_traces], dtype=int)
+        likelihoods = np.array([self.get_answer_likelihood(trace.get_exercise(), trace.get_success())
+                                if trace.get_kc() in self.kc_axes else np.ones(2) for trace in learner_traces])
+        return self.batch_update(np.stack(beliefs), kc_axes, likelihoods)
+
+    def batch_filter(self, kc_axes, success_likelihoods, successes, mask, batch_size=1024):
+        """
+        Vectorized forward filtering over the padded traces of several learners.
+        :param kc_axes: np.array of shape (n_learners, n_steps), the axis of the evaluated KC of each step -- -1 for the
+        KCs the engine does not handle
+        :param success_likelihoods: np.array of shape (n_learners, n_steps, 2), the probability of a success given the
+        state of the evaluated KC at each step
+        :param successes: np.array of shape (n_learners, n_steps), the success of the answer of each step
+        :param mask: np.array of shape (n_learners, n_steps), False for padding steps
+        :param batch_size: int, the number of learners whose belief states are held in memory at once
+        :return: np.array of shape (n_learners, n_steps+1, n_kcs) in the KC order of the learner pool, the i-th step of
+        a learner taking into account its i first traces -- nan after its last trace
+        """
+        n_learners, n_steps = mask.shape
+        likelihoods = np.where(successes[..., np.newaxis], success_likelihoods, 1 - success_likelihoods)
+        mastering_pbas = np.full((n_learners, n_steps + 1, self.n_kcs), np.nan)
+        initial_belief = self.get_initial_belief_state()
+        for start in range(0, n_learners, batch_size):
+            stop = min(start + batch_size, n_learners)
+            beliefs = np.repeat(initial_belief[np.newaxis], stop - start, axis=0)
+            mastering_pbas[start:stop, 0] = self.get_marginals(beliefs)[:, self.pool_kc_axes]
+            for step in range(n_steps):
+                active = np.flatnonzero(mask[start:stop, step])
+                if len(active) == 0:
+                    break
+                beliefs[active] = self.batch_update(beliefs[active], kc_axes[start + active, step],
+                                                    likelihoods[start + active, step])
+                mastering_pbas[start + active, step + 1] = self.get_marginals(beliefs[active])[:, self.pool_kc_axes]
+        return mastering_pbas
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+
+class KnowledgeStateFrame(object):
+
+    def __init__(self, mastering_probabilities, knowledge_components, learner_ids=None, success_probabilities=None,
+                 mask=None):
+        """
+        Columnar result of the inference of the knowledge states of several learners along their traces: one float per
+        (learner, step, KC), stored in one NumPy array whose KC columns are contiguous, so that the export to pandas and
+        Arrow does not copy them.
+        :param mastering_probabilities: np.array of shape (n_learners, n_steps+1, n_kcs), the mastering probability of
+        every KC of every learner after each of its traces -- nan after its last trace
+        :param knowledge_components: list of KnowledgeComponent objects, in the order of the last axis
+        :param learner_ids: list of the ids of the learners -- defaults to their positions
+        :param success_probabilities: np.array of shape (n_learners, n_steps), the predicted probability to answer
+        correctly each trace given the previous ones -- nan after the last trace of a learner
+        :param mask: np.array of shape (n_learners, n_steps), False for the padding steps -- defaults to the steps
+        before the first nan of the mastering probabilities
+        """
+        n_learners, n_slices, n_kcs = mastering_probabilities.shape
+        assert n_kcs == len(knowledge_components), "One KC is expected per column."
+        self.knowledge_components = list(knowledge_components)
+        self.kc_ids = [kc.id for kc in self.knowledge_components]
+        self.learner_ids = list(range(n_learners)) if learner_ids is None else list(learner_ids)
+        assert len(self.learner_ids) == n_learners, "One learner id is expected per learner."
+        self.learner_rows = {learner_id: i for i, learner_id in enumerate(self.learner_ids)}
+        if mask is None:
+            self.n_traces = (~np.isnan(mastering_probabilities[:, :, 0])).sum(axis=1) - 1
+        else:
+            self.n_traces = np.asarray(mask).sum(axis=1)
+        # rows are the (learner, step) pairs, columns the KCs, in column-major order
+        self.values = np.asfortranarray(mastering_probabilities.reshape(n_learners * n_slices, n_kcs))
+        self.n_learners, self.n_slices = n_learners, n_slices
+        self.success_probabilities = success_probabilities
+
+    def __len__(self):
+        return self.n_learners
+
+    @property
+    def mastering_probabilities(self):
+        """
+        The mastering probabilities as a (n_learners, n_steps+1, n_kcs) view.
+        """
+        return self.values.reshape(self.n_learners, self.n_slices, len(self.kc_ids))
+
+    def get_n_traces(self):
+        """
+        Return the number of traces of each learner.
+        :return: np.array of shape (n_learners,)
+        """
+        return self.n_traces
+
+    def get_learner_trajectory(self, learner_id):
+        """
+        Return the mastering probabilities of a learner after each of its traces.
+        :return: np.array of shape (n_traces+1, n_kcs)
+        """
+        i = self.learner_rows[learner_id]
+        return self.mastering_probabilities[i, :self.n_traces[i] + 1]
+
+    def get_final_mastering_probabilities(self):
+        """
+        Return the mastering probabilities of every learner after its last trace.
+        :return: np.array of shape (n_learners, n_kcs)
+        """
+        return self.mastering_probabilities[np.arange(self.n_learners), self.get_n_traces()]
+
+    def get_flat_success_probabilities(self):
+        """
+        Return the predicted success probabilities of all the traces, learner after learner, as the concatenation of
+        the Learner.predict_sequence of every learner.
+        :return: np.array of shape (n_traces,)
+        """
+        assert self.success_probabilities is not None, "The success probabilities have not been predicted."
+        return self.success_probabilities[~np.isnan(self.success_probabilities)]
+
+    def to_knowledge_states(self, learner_id, step=-1):
+        """
+        Return the knowledge state of a learner in the dict format of predict_learner_knowledge_states_from_learner_traces.
+        :param step: int, the number of traces taken into account -- defaults to all the traces of the learner
+        :return: dict {f"{kc.id}": mastering probability}
+        """
+        return {f"{kc_id}": pba for kc_id, pba in zip(self.kc_ids, self.get_learner_trajectory(learner_id)[step])}
+
+    def to_pandas(self):
+        """
+        Export the mastering probabilities as a DataFrame with one row per (learner, step) and one column per KC id,
+        the padding rows being dropped. The KC columns are views of the frame when there is no padding.
+        :return: pd.DataFrame indexed by (learner, step)
+        """
+        index = pd.MultiIndex.from_product([self.learner_ids, range(self.n_slices)], names=['learner', 'step'])
+        data_frame = pd.DataFrame(self.values, index=index, columns=self.kc_ids, copy=False)
+        if np.isnan(self.values[:, 0]).any():
+            data_frame = data_frame[~np.isnan(self.values[:, 0])]
+        return data_frame
+
+    def to_arrow(self):
+        """
+        Export the mastering probabilities as an Arrow table with the learner, the step and one column per KC id
+        (padding rows included, as nan). The KC columns are not copied. Needs pyarrow.
+        :return: pyarrow.Table
+        """
+        import pyarrow as pa
+
+        columns = {'learner': pa.array(np.repeat(self.learner_ids, self.n_slices)),
+                   'step': pa.array(np.tile(np.arange(self.n_slices), self.n_learners))}
+        for j, kc_id in enumerate(self.kc_ids):
+            columns[f"{kc_id}"] = pa.array(self.values[:, j])
+        return pa.table(columns)
@@ -12,17 +12,30 @@ class Learner(object):
         """
         Initialization of Learner object.
         :param learner_id: id of the learner
-        :param domain_graph: domain graph of the domain that the Learner studies
+        :param learner_pool: LearnerPool object, the pool the Learner belongs to
         """
         self.id = learner_id
-        self.learner_pool = learner_pool
-        if self.learner_pool:
-            self.learner_pool.add_learner(self)
-            knowledge_components = self.learner_pool.get_knowledge_components()
-            self.mastering_probabilities = {kc: self.learner_pool.get_prior(kc) for kc in knowledge_components}
+        self.learner_pool = None
+        # None as long as the mastering probabilities are the priors of the pool (copied at first change)
+        self._mastering_probabilities = None
+        self.belief_state = None
+        if learner_pool:
+            self.change_learner_pool(learner_pool)
 
     def change_learner_pool(self, new_learner_pool):
-        self.__init__(self.id, new_learner_pool)
+        self.learner_pool = new_learner_pool
+        self._mastering_probabilities, self.belief_state = None, None
+        new_learner_pool.add_learner(self)
+
+    @property
+    def mastering_probabilities(self):
+        if self._mastering_probabilities is None:
+            return self.learner_pool.priors
+        return self._mastering_probabilities
+
+    @mastering_probabilities.setter
+    def mastering_probabilities(self, mastering_probabilities):
+        self._mastering_probabilities = mastering_probabilities
 
     @staticmethod
     def get_guess_from_exercise(exercise):
@@ -30,10 +43,11 @@ class Learner(object):
         # TODO: adapt the guess parameter to the self learner
         return guess
 
-    @staticmethod
     def set_mastering_probability(self, kc, prior):
         assert kc in self.mastering_probabilities.keys()
-        self.mastering_probabilities[kc] = prior
+        if self._mastering_probabilities is None:
+            self._mastering_probabilities = dict(self.learner_pool.priors)
+        self._mastering_probabilities[kc] = prior
 
     def get_mastering_probability(self, kc):
         return self.mastering_probabilities[kc]
@@ -45,14 +59,100 @@ class Learner(object):
     def get_priors(self):
         return {kc.name: self.get_mastering_probability(kc) for kc in self.learner_pool.get_knowledge_components()}
 
-    def predict_sequence(self, learner_traces, inference_model_type, params):
+    def get_filtering_engine(self):
+        inference_model = self.learner_pool.get_inference_model()
+        assert inference_model is not None, "An inference model must be set on the learner pool."
+        return inference_model.get_filtering_engine()
+
+    def get_belief_state(self):
+        """
+        Return the belief state of the learner over the KCs given the traces observed so far, starting from the initial
+        belief state of the inference model of its learner pool.
+        """
+        if self.belief_state is None:
+            self.belief_state = self.get_filtering_engine().get_initial_belief_state()
+        return self.belief_state
+
+    def reset_belief_state(self):
+        """
+        Forget the traces observed so far, e.g. when the inference model of the learner pool changes.
+        """
+        self.belief_state = None
+        self._mastering_probabilities = None
+
+    def observe(self, learner_trace):
+        """
+        Update the knowledge state of the learner with a new trace, in a time that does not depend on the number of
+        traces already observed: only the belief state of the learner is carried forward.
+        :param learner_trace: LearnerTrace object, the last answer of the learner
+        :return: dict {kc: mastering probability}, the mastering probabilities after the trace
+        """
+        self.belief_state = self.get_filtering_engine().update(self.get_belief_state(), learner_trace)
+        self.mastering_probabilities = self.get_belief_state_marginals()
+        return self.mastering_probabilities
+
+    def get_belief_state_marginals(self):
+        engine = self.get_filtering_engine()
+        marginals = dict(zip(engine.knowledge_components, engine.get_marginals(self.get_belief_state())))
+        return {kc: marginals[kc] for kc in self.learner_pool.get_knowledge_components()}
+
+    def predict_answer(self, exercise):
+        """
+        Predict the probability that the learner answers correctly an exercise given the traces observed so far.
+        :param exercise: Exercise object
+        """
+        m_pba = self.get_belief_state_marginals()[exercise.get_kc()]
+        slip, guess = self.learner_pool.get_slip(exercise), self.learner_pool.get_guess(exercise)
+        return m_pba * (1 - slip) + (1 - m_pba) * guess
+
+    def score_next_exercises(self, exercises=None):
+        """
+        Score every candidate exercise for the next answer of the learner from its current belief state (see
+        JointStateEngine.score_exercises), without replaying its traces.
+        :param exercises: list of Exercise objects, the candidates -- defaults to all the exercises of the domain
+        """
+        engine = self.get_filtering_engine()
+        assert hasattr(engine, 'score_exercises'), "The inference model must filter with an exact engine."
+        return engine.score_exercises(self.get_belief_state(), exercises)
+
+    def predict_sequence(self, learner_traces, inference_model_type, params, mode=None, prefix_cache=None,
+                         min_run_length=None, inference_model=None):
+        """
+        Predict the probability of each answer of the learner given the previous ones.
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :param inference_model_type: str, 'NoisyAND' or 'NoisyOR'
+        :param params: dict, the parameters of the inference model
+        :param mode: str, 'filtering' to carry the belief state forward in a single pass, 'unrolled' to unroll the
+        dynamic bayesian network over every prefix of learner_traces -- defaults to 'filtering' if the model can filter
+        the traces exactly in reasonable time (see InferenceModel.can_filter_exactly), else to 'unrolled'
+        :param prefix_cache: PrefixTrieCache object, in filtering mode, the cache of the belief states of the prefixes of
+        the traces shared across learners
+        :param min_run_length: int, in filtering mode, the length from which the runs of identical answers are carried
+        by the matrix of their update (see JointStateEngine.iter_filter_runs)
+        :param inference_model: inference model of the given type on the learner pool of the learner, whose parameters
+        are refreshed in place with params (see InferenceModel.refresh_parameters) instead of building a new model
+        :return: list of floats, the probability to answer correctly each trace
+        """
+        assert mode in (None, 'filtering', 'unrolled'), f"Given mode {mode} unknown"
         n_eval = len(learner_traces)
         if inference_model_type == 'NoisyAND':
-            inference_model = NoisyANDInferenceModel(self.learner_pool, {'c': params['c'], 's': params['s']})
+            model_params = {'c': params['c'], 's': params['s']}
+            model_class = NoisyANDInferenceModel
         elif inference_model_type == 'NoisyOR':
-            inference_model = NoisyORInferenceModel(self.learner_pool, params['c'])
+            model_params = params['c']
+            model_class = NoisyORInferenceModel
         else:
             return Exception('This type of inference model is not handled.')
+        if inference_model is None:
+            inference_model = model_class(self.learner_pool, model_params)
+        else:
+            assert isinstance(inference_model, model_class), f"{inference_model_type} inference model expected."
+            inference_model.refresh_parameters(model_params)
+        if mode is None:
+            mode = 'filtering' if inference_model.can_filter_exactly(learner_traces) else 'unrolled'
+        if mode == 'filtering':
+            return inference_model.predict_learner_answers_from_learner_traces(learner_traces, prefix_cache,
+                                                                               min_run_length)
         correct_predictions, exercises = [], []
         for trace in learner_traces:
             exercise = trace.get_exercise()
@@ -2,8 +2,12 @@ import numpy as np
 import dill
 from kgraph.expert_layer.domain import Domain
 from kgraph.learner_layer.learner import Learner
+from kgraph.learner_layer.inference_model import NoisyANDInferenceModel, NoisyORInferenceModel
+from kgraph.learner_layer.inference_backends import get_inference_backend
+from kgraph.learner_layer.learner_pool_parameters import LearnerPoolParameters
 import pyAgrum as gum
 import itertools
+import threading
 from lmfit import Minimizer, Parameters, fit_report
 import sklearn.metrics as sk_metrics
 
@@ -19,24 +23,90 @@ class LearnerPool(object):
         :param domain : the domain on which the learner of the LearnerPool study.
         """
         self.desc = desc
-        self.learners = []
+        # learners by id
+        self._learners_by_id = {}
         self.domain = domain
         self.knowledge_components = self.domain.get_knowledge_components()
         if params is None:
-            self.priors = {kc: .2 for kc in self.knowledge_components}
-            self.learns = {kc: .1 for kc in self.knowledge_components}
-            self.forgets = {kc: .05 for kc in self.knowledge_components}
+            priors = {kc: .2 for kc in self.knowledge_components}
+            learns = {kc: .1 for kc in self.knowledge_components}
+            forgets = {kc: .05 for kc in self.knowledge_components}
 
-            self.slips = {x: 0.1 for kc in self.knowledge_components for x in kc.get_exercises()}
-            self.guesses = {x: 0.1 for kc in self.knowledge_components for x in kc.get_exercises()}
+            slips = {x: 0.1 for kc in self.knowledge_components for x in kc.get_exercises()}
+            guesses = {x: 0.1 for kc in self.knowledge_components for x in kc.get_exercises()}
         else:
-            self.priors = {kc: params.loc[f'{kc.id}', 'prior', 'default'].value for kc in self.knowledge_components}
-            self.learns = {kc: params.loc[f'{kc.id}', 'learns', f'{kc.id}'].value for kc in self.knowledge_components}
-            self.forgets = {kc: params.loc[f'{kc.id}', 'forgets', f'{kc.id}'].value for kc in self.knowledge_components}
-            self.slips = {ex: params.loc[f'{kc.id}', 'slips', f'{ex.id}'].value for kc in self.knowledge_components for ex in kc.get_exercises()}
-            self.guesses = {ex: params.loc[f'{kc.id}', 'guesses', f'{ex.id}'].value for kc in self.knowledge_components for ex in kc.get_exercises()}
+            priors = {kc: params.loc[f'{kc.id}', 'prior', 'default'].value for kc in self.knowledge_components}
+            learns = {kc: params.loc[f'{kc.id}', 'learns', f'{kc.id}'].value for kc in self.knowledge_components}
+            forgets = {kc: params.loc[f'{kc.id}', 'forgets', f'{kc.id}'].value for kc in self.knowledge_components}
+            slips = {ex: params.loc[f'{kc.id}', 'slips', f'{ex.id}'].value for kc in self.knowledge_components for ex in kc.get_exercises()}
+            guesses = {ex: params.loc[f'{kc.id}', 'guesses', f'{ex.id}'].value for kc in self.knowledge_components for ex in kc.get_exercises()}
+
+        # the parameters are published as immutable snapshots, the lock being only taken by the writers
+        self.parameters = LearnerPoolParameters(priors, learns, forgets, slips, guesses, link_strengths)
+        self.parameters_lock = threading.Lock()
+        self.inference_backend = None
+        self.inference_model = None
+
+    @property
+    def learners(self):
+        """
+        The learners of the LearnerPool, in their order of addition.
+        """
+        return self._learners_by_id.values()
+
+    @property
+    def priors(self):
+        return self.parameters.priors
+
+    @property
+    def learns(self):
+        return self.parameters.learns
+
+    @property
+    def forgets(self):
+        return self.parameters.forgets
+
+    @property
+    def slips(self):
+        return self.parameters.slips
+
+    @property
+    def guesses(self):
+        return self.parameters.guesses
+
+    @property
+    def link_strengths(self):
+        return self.parameters.link_strengths
+
+    def get_parameters(self):
+        """
+        Return the current snapshot of the parameters, that readers can pin to read consistent parameters while they
+        are updated.
+        :return: LearnerPoolParameters object
+        """
+        return self.parameters
+
+    def get_parameters_version(self):
+        return self.parameters.version
+
+    def __getstate__(self):
+        # the lock is not pickled, e.g. when the learner pool is sent to the workers of a process pool
+        state = dict(self.__dict__)
+        del state['parameters_lock']
+        return state
 
-        self.link_strengths = link_strengths
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.parameters_lock = threading.Lock()
+
+    def update_parameters(self, priors=None, learns=None, forgets=None, slips=None, guesses=None, link_strengths=None):
+        """
+        Change several parameters at once, publishing a single new snapshot of the parameters.
+        :param priors: dict {kc: prior}, the priors to be changed -- and so on for the other parameters
+        :param link_strengths: dict {kc: {parent kc: strength}}, the link strengths to be changed
+        """
+        with self.parameters_lock:
+            self.parameters = self.parameters.updated(priors, learns, forgets, slips, guesses, link_strengths)
 
     def __str__(self):
         string = f'The LearnerPool {self.desc} contains {len(self.learners)} learners' \
@@ -46,14 +116,17 @@ class LearnerPool(object):
     def add_learner(self, learner):
         """
         Add a learner in the LearnerPool.
-        :param learner: Learner object, the learner to be added
+        :param learner: Learner object, the learner to be added -- it replaces the learner of the LearnerPool that has
+        the same id, if any
         """
         if isinstance(learner, list):
             for elt in learner:
                 self.add_learner(elt)
-        if learner not in self.learners and learner.id != 0:
-            self.learners.append(learner)
-            learner.change_learner_pool(self)
+            return
+        if learner.id != 0 and self._learners_by_id.get(learner.id) is not learner:
+            self._learners_by_id[learner.id] = learner
+            if learner.learner_pool is not self:
+                learner.change_learner_pool(self)
 
     def get_exercise_from_id(self, exercise_id):
         exercise_list = [exercise for kc in self.knowledge_components for exercise in kc.get_exercises()]
@@ -67,7 +140,7 @@ class LearnerPool(object):
         :param strength: the wished strength of the link
         """
         assert strength in ['strong', 'weak']
-        self.link_strengths[source_kc][target_kc] = strength
+        self.update_parameters(link_strengths={source_kc: {target_kc: strength}})
 
     def get_link_strength(self, source_kc, target_kc):
         """
@@ -134,7 +207,7 @@ class LearnerPool(object):
         Return the ids of the learners that belong to LearnerPool.
         :return: the list of learners' ids.
         """
-        return [learner.id for learner in self.learners]
+        return list(self._learners_by_id.keys())
 
     def get_learner_from_id(self, learner_id):
         """
@@ -142,7 +215,7 @@ class LearnerPool(object):
         :param learner_id: id of the searched learner
         :return: Learner object that has learner_id as id
         """
-        return [learner for learner in self.learners if learner.id == learner_id]
+        return [self._learners_by_id[learner_id]] if learner_id in self._learners_by_id else []
 
     def get_random_learner(self):
         """
@@ -153,7 +226,7 @@ class LearnerPool(object):
         from random import randint
         # seed random number generator
         seed(1)
-        return self.learners[randint(0, len(self.learners))]
+        return list(self.learners)[randint(0, len(self.learners) - 1)]
 
     def get_learner_pool_kc_parents(self, kc):
         return [parent for parent in self.link_strengths[kc].keys() if self.get_link_strength(parent, kc)!='not existing']
@@ -162,38 +235,62 @@ class LearnerPool(object):
         return [child for child in self.link_strengths.keys() if kc in list(self.link_strengths[child].keys())]
 
     def set_learn(self, kc, val):
-        self.learns[kc] = val
+        self.update_parameters(learns={kc: val})
 
     def set_prior(self, kc, val):
-        self.priors[kc] = val
+        self.update_parameters(priors={kc: val})
 
     def set_slip(self, exercise, val):
         from kgraph.resources_layer.exercise import Exercise
         assert isinstance(exercise, Exercise), "Exercise expected"
-        self.slips[exercise] = val
+        self.update_parameters(slips={exercise: val})
 
     def set_guess(self, exercise, val):
         from kgraph.resources_layer.exercise import Exercise
         assert isinstance(exercise, Exercise), "Exercise expected"
-        self.guesses[exercise] = val
+        self.update_parameters(guesses={exercise: val})
 
     def set_forget(self, kc, val):
-        self.forgets[kc] = val
+        self.update_parameters(forgets={kc: val})
+
+    def set_inference_backend(self, backend, **options):
+        """
+        Set the inference backend used by the inference models of the LearnerPool that do not specify one.
+        :param backend: str, the name of a registered backend (see kgraph.learner_layer.inference_backends)
+        :param options: the tuning options of the backend (e.g. max_time=.5 for 'weighted_sampling')
+        """
+        self.inference_backend = get_inference_backend(backend, **options)
+
+    def get_inference_backend(self):
+        return self.inference_backend
+
+    def set_inference_model(self, inference_model):
+        """
+        Set the inference model with which the learners of the LearnerPool update their knowledge states online.
+        :param inference_model: NoisyANDInferenceModel or NoisyORInferenceModel object, built on the LearnerPool
+        """
+        assert inference_model.associated_learner_pool is self, "The inference model must be built on the LearnerPool."
+        self.inference_model = inference_model
+        for learner in self.learners:
+            learner.reset_belief_state()
+
+    def get_inference_model(self):
+        return self.inference_model
 
     def get_learn(self, kc):
-        return self.learns[kc]
+        return self.parameters.learns[kc]
 
     def get_prior(self, kc):
-        return self.priors[kc]
+        return self.parameters.priors[kc]
 
     def get_slip(self, exercise):
-        return self.slips[exercise]
+        return self.parameters.slips[exercise]
 
     def get_guess(self, exercise):
-        return self.guesses[exercise]
+        return self.parameters.guesses[exercise]
 
     def get_forget(self, kc):
-        return self.forgets[kc]
+        return self.parameters.forgets[kc]
 
     def is_kc_learnable(self, kc, evaluated_kc, learn_prop):
         if learn_prop == 'all':
@@ -243,6 +340,9 @@ class LearnerPool(object):
                     cs_params.add(f'c_{parent.id}_{kc.id}', value=1, vary=True, min=0.5, max=1, brute_step=10e-2)
                     cs_params.add(f's_{parent.id}_{kc.id}', value=0, vary=True, min=0, max=.5, brute_step=10e-2)
 
+            # the structure of the model is built once, the values of each evaluation are then refreshed in place
+            inference_model = NoisyANDInferenceModel(self, None)
+
             def f(p, **kwargs):
                 par = p.valuesdict()
                 learner_traces = kwargs["learner_traces"]
@@ -264,7 +364,8 @@ class LearnerPool(object):
                     ]))
                     pred = np.concatenate((pred,
                                            learner.predict_sequence([trace for trace in learner_traces[learner]],
-                                                                    inference_model_type, {'c': c, 's': s})
+                                                                    inference_model_type, {'c': c, 's': s},
+                                                                    inference_model=inference_model)
                                           ))
                 cohen_kappa = max([
                     sk_metrics.cohen_kappa_score(np.array(exp),
@@ -286,6 +387,8 @@ class LearnerPool(object):
                 for parent in self.link_strengths[kc]:
                     c_params.add(f'c_{parent.id}_{kc.id}', value=1, vary=True, min=.5, max=1, brute_step=10e-2)
 
+            inference_model = NoisyORInferenceModel(self, None)
+
             def f(p, **kwargs):
                 par = p.valuesdict()
                 learner_traces = kwargs["learner_traces"]
@@ -304,7 +407,8 @@ class LearnerPool(object):
                     ]))
                     pred = np.concatenate((pred,
                                            learner.predict_sequence([trace for trace in learner_traces[learner]],
-                                                                    inference_model_type, {'c': c})
+                                                                    inference_model_type, {'c': c},
+                                                                    inference_model=inference_model)
                                            ))
                 cohen_kappa = max([
                     sk_metrics.cohen_kappa_score(np.array(exp),
@@ -0,0 +1,145 @@
+import itertools
+from collections.abc import Mapping
+
+# versions are unique and increasing across all the parameter snapshots
+parameters_versions = itertools.count()
+
+
+def get_new_parameters_version():
+    return next(parameters_versions)
+
+
+class ParameterMapping(Mapping):
+
+    def __init__(self, values, changes=None):
+        """
+        Read-only mapping of one kind of parameters of a snapshot: values shared with former snapshots, never copied,
+        overlaid with the changes made since them. A new snapshot copies the changes only, which are folded into new
+        values once their number exceeds the square root of the number of values (see updated), so that a sequence of
+        single changes costs O(sqrt(n)) per change instead of O(n).
+        :param values: dict, the shared values
+        :param changes: dict, the values that replace or extend them
+        """
+        self._values = values
+        self._changes = changes if changes is not None else {}
+        self._n_new_keys = sum(1 for key in self._changes if key not in values)
+
+    def __getitem__(self, key):
+        if key in self._changes:
+            return self._changes[key]
+        return self._values[key]
+
+    def __contains__(self, key):
+        return key in self._changes or key in self._values
+
+    def __iter__(self):
+        yield from self._values
+        for key in self._changes:
+            if key not in self._values:
+                yield key
+
+    def __len__(self):
+        return len(self._values) + self._n_new_keys
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)})"
+
+    def updated(self, changes):
+        """
+        Return a new mapping where the given values replace the ones of this mapping.
+        :param changes: dict, the values to be changed
+        :return: ParameterMapping object
+        """
+        changes = {**self._changes, **changes}
+        if len(changes) ** 2 > len(self._values):
+            return ParameterMapping({**self._values, **changes})
+        return ParameterMapping(self._values, changes)
+
+    def get_candidate_keys(self, former_mapping):
+        """
+        Return the keys whose values may differ between a former mapping and this one: the changed ones only if both
+        share their values, else all of them.
+        :param former_mapping: Mapping object
+        :return: set of keys
+        """
+        if isinstance(former_mapping, ParameterMapping) and former_mapping._values is self._values:
+            return former_mapping._changes.keys() | self._changes.keys()
+        return former_mapping.keys() | self.keys()
+
+
+class LearnerPoolParameters(object):
+
+    def __init__(self, priors, learns, forgets, slips, guesses, link_strengths):
+        """
+        Immutable snapshot of the parameters of a LearnerPool. A new snapshot, with a new version, is published at each
+        change of the parameters: readers that pin a snapshot keep on reading consistent parameters without any lock,
+        while the changes only are copied for the new snapshot (see updated and ParameterMapping).
+        :param priors: dict {kc: prior}
+        :param learns: dict {kc: learn}
+        :param forgets: dict {kc: forget}
+        :param slips: dict {exercise: slip}
+        :param guesses: dict {exercise: guess}
+        :param link_strengths: dict {kc: {parent kc: strength}}
+        """
+        self.version = get_new_parameters_version()
+        self.priors = ParameterMapping(dict(priors))
+        self.learns = ParameterMapping(dict(learns))
+        self.forgets = ParameterMapping(dict(forgets))
+        self.slips = ParameterMapping(dict(slips))
+        self.guesses = ParameterMapping(dict(guesses))
+        self.link_strengths = ParameterMapping({kc: ParameterMapping(dict(parents))
+                                                for kc, parents in link_strengths.items()})
+
+    def updated(self, priors=None, learns=None, forgets=None, slips=None, guesses=None, link_strengths=None):
+        """
+        Return a new snapshot where the given values replace the ones of this snapshot.
+        :param priors: dict {kc: prior}, the priors to be changed -- and so on for the other parameters
+        :param link_strengths: dict {kc: {parent kc: strength}}, the link strengths to be changed
+        :return: LearnerPoolParameters object
+        """
+        parameters = object.__new__(LearnerPoolParameters)
+        parameters.version = get_new_parameters_version()
+        for name, changes in (('priors', priors), ('learns', learns), ('forgets', forgets), ('slips', slips),
+                              ('guesses', guesses)):
+            values = getattr(self, name)
+            setattr(parameters, name, values.updated(changes) if changes else values)
+        parameters.link_strengths = self.link_strengths
+        if link_strengths:
+            parameters.link_strengths = self.link_strengths.updated({
+                kc: ParameterMapping({**self.link_strengths.get(kc, {}), **parents})
+                for kc, parents in link_strengths.items()})
+        return parameters
+
+    def get_changes(self, parameters):
+        """
+        Return the KCs and exercises whose parameters differ between a former snapshot and this one. The mappings that
+        a snapshot shares with the former one (see updated) are not compared, nor the values shared by their mappings
+        (see ParameterMapping.get_candidate_keys).
+        :param parameters: LearnerPoolParameters object, the former snapshot
+        :return: dict {name of the parameters ('priors', 'learns', ..., 'link_strengths'): set of the changed keys}
+        """
+        changes = {}
+        for name in ('priors', 'learns', 'forgets', 'slips', 'guesses', 'link_strengths'):
+            former_values, values = getattr(parameters, name), getattr(self, name)
+            if former_values is values:
+                changes[name] = set()
+                continue
+            changes[name] = {key for key in values.get_candidate_keys(former_values)
+                             if former_values.get(key) is not values.get(key) and
+                             (key not in former_values or key not in values or former_values[key] != values[key])}
+        return changes
+
+    def get_prior(self, kc):
+        return self.priors[kc]
+
+    def get_learn(self, kc):
+        return self.learns[kc]
+
+    def get_forget(self, kc):
+        return self.forgets[kc]
+
+    def get_slip(self, exercise):
+        return self.slips[exercise]
+
+    def get_guess(self, exercise):
+        return self.guesses[exercise]
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+
+class PrefixTrieNode(object):
+
+    def __init__(self, belief, parent=None, key=None):
+        """
+        Node of a PrefixTrieCache: the belief state of a learner after the sequence of answers that leads to it.
+        :param belief: the belief state, as returned by the engine
+        :param parent: PrefixTrieNode object, None for a root
+        :param key: the key of the node in the children of its parent (or in the roots of the cache)
+        """
+        self.belief = belief
+        self.parent = parent
+        self.key = key
+        self.children = {}
+
+
+class PrefixTrieCache(object):
+
+    def __init__(self, max_nodes=100000):
+        """
+        Bounded cache of belief states shared across learners, stored in a trie whose edges are the (exercise id,
+        success) pairs of the learner traces. There is one trie per parameter version (fingerprint of the compiled
+        engine), so that two learners who start with the same answers under the same parameters share the belief states
+        of their common prefix. When the cache is full, the least recently used leaves are evicted.
+        :param max_nodes: int, the maximal number of belief states kept in the cache
+        """
+        self.max_nodes = max_nodes
+        self.roots = {}
+        # every node of the tries, from the least to the most recently used -- a node being always used after its
+        # descendants, the least recently used node is a leaf
+        self.nodes = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get_belief_states(self, engine, learner_traces):
+        """
+        Return the belief states of a learner after every prefix of its traces, computing only the ones that are not
+        in the cache.
+        :param engine: JointStateEngine object (or any engine with get_fingerprint, get_initial_belief_state and update)
+        :param learner_traces: list of LearnerTrace objects, in chronological order
+        :return: list of the len(learner_traces)+1 belief states, the i-th one being the one after learner_traces[:i]
+        """
+        version = engine.get_fingerprint()
+        if version not in self.roots:
+            self.roots[version] = PrefixTrieNode(engine.get_initial_belief_state(), key=version)
+        path = [self.roots[version]]
+        for trace in learner_traces:
+            node, key = path[-1], (trace.get_exercise().id, bool(trace.get_success()))
+            if key in node.children:
+                self.hits += 1
+            else:
+                self.misses += 1
+                node.children[key] = PrefixTrieNode(engine.update(node.belief, trace), node, key)
+            path.append(node.children[key])
+        for node in reversed(path):
+            self.nodes[id(node)] = node
+            self.nodes.move_to_end(id(node))
+        self._evict(self.max_nodes)
+        return [node.belief for node in path]
+
+    def _evict(self, max_nodes):
+        while len(self.nodes) > max_nodes:
+            _, node = self.nodes.popitem(last=False)
+            if node.parent is None:
+                del self.roots[node.key]
+            else:
+                del node.parent.children[node.key]
+
+    def set_max_nodes(self, max_nodes):
+        self.max_nodes = max_nodes
+        self._evict(self.max_nodes)
+
+    def clear(self):
+        self.roots.clear()
+        self.nodes.clear()
+        self.hits, self.misses = 0, 0
+
+    def get_hit_rate(self):
+        n_calls = self.hits + self.misses
+        return self.hits / n_calls if n_calls else 0.
+
+
+prefix_trie_cache = PrefixTrieCache()
@@ -0,0 +1,64 @@
+import random
+import warnings
+import numpy as np
+from kgraph.expert_layer.domain import Domain
+from kgraph.expert_layer.knowledge_components import KnowledgeComponent
+from kgraph.expert_layer.link import Link
+from kgraph.resources_layer.exercise import Exercise
+from kgraph.learner_layer.learner import Learner
+from kgraph.learner_layer.learner_pool import LearnerPool
+from kgraph.learner_layer.evaluation import LearnerTrace
+from kgraph.learner_layer.inference_model import NoisyANDInferenceModel
+from kgraph.learner_layer.factored_frontier import get_kc_clusters_from_prerequisite_graph
+
+warnings.filterwarnings('ignore')
+
+
+def make_model(n_kcs=40, n_extra_links=15, seed=0):
+    """
+    Return a NoisyAND inference model on a chain of KCs with random extra links, and the exercises of its KCs.
+    """
+    rng = random.Random(seed)
+    kcs = [KnowledgeComponent(i + 1, f"KC{i}") for i in range(n_kcs)]
+    exercises = [Exercise(10 * (i + 1), kc, "qcm", ex_content="", params={}) for i, kc in enumerate(kcs)]
+    links = {(i, i + 1) for i in range(n_kcs - 1)}
+    while len(links) < n_kcs - 1 + n_extra_links:
+        source, target = sorted(rng.sample(range(n_kcs), 2))
+        links.add((source, target))
+    link_strengths = {}
+    for source, target in links:
+        link_strengths.setdefault(kcs[target], {})[kcs[source]] = 'strong'
+    learner_pool = LearnerPool(Domain(kcs, [Link(kcs[source], kcs[target]) for source, target in links]),
+                               link_strengths)
+    for kc in kcs:
+        learner_pool.set_prior(kc, rng.uniform(.1, .6))
+        learner_pool.set_learn(kc, rng.uniform(.05, .3))
+        learner_pool.set_forget(kc, rng.uniform(0, .1))
+    for exercise in exercises:
+        learner_pool.set_guess(exercise, rng.uniform(.05, .3))
+        learner_pool.set_slip(exercise, rng.uniform(.05, .2))
+    c_params, s_params = {}, {}
+    for source, target in links:
+        c_params.setdefault(kcs[source], {})[kcs[target]] = rng.uniform(.6, 1)
+        s_params.setdefault(kcs[source], {})[kcs[target]] = rng.uniform(0, .4)
+    return NoisyANDInferenceModel(learner_pool, {'c': c_params, 's': s_params}), exercises
+
+
+def test_factored_frontier_stays_normalized_over_many_steps():
+    model, exercises = make_model()
+    learner = Learner(1, model.associated_learner_pool)
+    rng = random.Random(1)
+    traces = [LearnerTrace(learner, rng.choice(exercises), rng.random() < .6) for _ in range(30)]
+    for max_cluster_size in (4, 8):
+        engine = model.get_factored_frontier_engine(max_cluster_size=max_cluster_size)
+        assert len(engine.clusters) > 1
+        for belief in engine.iter_filter(traces):
+            assert np.allclose([tensor.sum() for tensor in belief], 1, rtol=0, atol=1e-12)
+            marginals = engine.get_marginals(belief)
+            assert np.all((marginals >= 0) & (marginals <= 1))
+
+
+def test_default_clusters_are_reproducible():
+    partitions = [[[kc.id for kc in kcs] for kcs in get_kc_clusters_from_prerequisite_graph(make_model()[0])]
+                  for _ in range(3)]
+    assert partitions[0] == partitions[1] == partitions[2]
@@ -0,0 +1,48 @@
+import random
+import warnings
+import numpy as np
+from kgraph.expert_layer.domain import Domain
+from kgraph.expert_layer.knowledge_components import KnowledgeComponent
+from kgraph.expert_layer.link import Link
+from kgraph.resources_layer.exercise import Exercise
+from kgraph.learner_layer.learner import Learner
+from kgraph.learner_layer.learner_pool import LearnerPool
+from kgraph.learner_layer.evaluation import LearnerTrace
+from kgraph.learner_layer.inference_model import NoisyANDInferenceModel
+
+warnings.filterwarnings('ignore')
+
+
+def make_chain_model(n_kcs=4, seed=0):
+    """
+    Return a NoisyAND inference model on a chain of KCs with a free KC, and the two exercises of each KC.
+    """
+    rng = random.Random(seed)
+    kcs = [KnowledgeComponent(i + 1, f"KC{i}") for i in range(n_kcs + 1)]
+    exercises = [Exercise(10 * (i + 1) + j, kc, "qcm", ex_content="", params={})
+                 for i, kc in enumerate(kcs) for j in range(2)]
+    links = [(i, i + 1) for i in range(n_kcs - 1)]
+    learner_pool = LearnerPool(Domain(kcs, [Link(kcs[source], kcs[target]) for source, target in links]),
+                               {kcs[target]: {kcs[source]: 'strong'} for source, target in links})
+    for kc in kcs:
+        learner_pool.set_prior(kc, rng.uniform(.1, .6))
+        learner_pool.set_learn(kc, rng.uniform(.05, .3))
+        learner_pool.set_forget(kc, rng.uniform(0, .1))
+    for exercise in exercises:
+        learner_pool.set_guess(exercise, rng.uniform(.05, .3))
+        learner_pool.set_slip(exercise, rng.uniform(.05, .2))
+    c_params = {kcs[source]: {kcs[target]: rng.uniform(.6, 1)} for source, target in links}
+    s_params = {kcs[source]: {kcs[target]: rng.uniform(0, .4)} for source, target in links}
+    return NoisyANDInferenceModel(learner_pool, {'c': c_params, 's': s_params}), exercises
+
+
+def test_run_matrices_match_the_plain_filtering():
+    model, exercises = make_chain_model()
+    learner = Learner(1, model.associated_learner_pool)
+    # long runs of identical answers, the last ones favouring states that the first ones make negligible
+    traces = [LearnerTrace(learner, exercises[0], True)] * 60 + [LearnerTrace(learner, exercises[4], False)] * 60 + \
+        [LearnerTrace(learner, exercises[6], True)] * 60 + [LearnerTrace(learner, exercises[8], True)] * 20
+    expected = model.predict_learner_answers_from_learner_traces(traces)
+    for min_run_length in (1, 8):
+        predictions = model.predict_learner_answers_from_learner_traces(traces, min_run_length=min_run_length)
+        assert np.allclose(predictions, expected, rtol=0, atol=1e-12)